@@ -1,282 +1,1997 @@
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, Response, request, jsonify, send_file, session, stream_with_context
 
-from database import get_db
+from database import engine, get_db
+
+from busca import criterio_busca
+
+from geo import caixa_delimitadora, haversine_km, cache_clusters, ZOOM_MAXIMO
+
+from caches import cache_contagens, notificar_alteracao
+
+from sincronizacao import MAX_ALTERACOES, alteracoes_desde, token_inicial
+
+from outbox import LOTE_EVENTOS, ler_eventos, registrar_eventos
+
+from importador import COLUNAS_PLANILHA
+
+from indice_facetas import indice_facetas
+
+import base64
+
+import csv
 
 import datetime
 
-from sqlalchemy.orm import joinedload
+import io
+
+import json
+
+import os
+
+import tempfile
+
+import uuid
+
+from decimal import Decimal
+
+import numpy as np
+
+from openpyxl import Workbook
+
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+from sqlalchemy import Integer, and_, cast, delete, func, insert, inspect, literal, null, or_, select, tuple_, union_all, update
+
+from sqlalchemy.orm import selectinload
+
+from pydantic import ValidationError
+
+from schemas import CredenciadoCreate, CredenciadoBulkUpdate
+
+from models import (
+
+    Credenciado, CredenciadoEspecialidade, CredenciadoDiferencial, CredenciadoRede, CredenciadoComplexidade,
+
+    CredenciadoExcluido, EventoCredenciado, Especialidade, Diferencial, Rede, CAMPOS_BUSCA, campos_busca, normalizar_texto
+
+)
+
+
+
+credenciados_bp = Blueprint('credenciados', __name__)
+
+
+
+ORDENACOES_CURSOR = {'id', 'nome'}
+
+
+
+CAMPOS_PROJECAO = (
+
+    'id', 'credenciamento', 'nome', 'crm', 'tipo', 'status', 'complexidade',
+
+    'logradouro', 'numero', 'bairro', 'cidade', 'estado', 'cep', 'telefone', 'email',
+
+    'latitude', 'longitude', 'parceiro_estrategico', 'tempo_medio_agendamento',
+
+    'tempo_medio_procedimento', 'data_contrato', 'ultima_atualizacao',
+
+)
+
+CAMPOS_LISTAGEM = (
+
+    'id', 'credenciamento', 'nome', 'tipo', 'status', 'cidade', 'estado', 'telefone', 'email',
+
+    'tempo_medio_agendamento', 'tempo_medio_procedimento', 'latitude', 'longitude',
+
+    'parceiro_estrategico', 'complexidade',
+
+)
+
+RELACOES = ('especialidades', 'diferenciais', 'redes', 'complexidades')
+
+RAIO_MAXIMO_KM = 500
+
+MODOS_FILTRO = ('or', 'and')
+
+MAX_IDS_LOTE = 1000
+
+FILTROS_ASSOCIACAO = (
+
+    ('especialidade_id', CredenciadoEspecialidade, CredenciadoEspecialidade.id_especialidade),
+
+    ('rede_id', CredenciadoRede, CredenciadoRede.id_rede),
+
+    ('diferencial_id', CredenciadoDiferencial, CredenciadoDiferencial.id_diferencial),
+
+)
+
+ASSOCIACOES_EDITAVEIS = (
+
+    ('especialidades_ids', CredenciadoEspecialidade, 'id_especialidade', Especialidade),
+
+    ('diferenciais_ids', CredenciadoDiferencial, 'id_diferencial', Diferencial),
+
+    ('redes_ids', CredenciadoRede, 'id_rede', Rede),
+
+    ('complexidades_especialidades_ids', CredenciadoComplexidade, 'id_especialidade', Especialidade),
+
+)
+
+CHAVES_ASSOCIACAO = {chave for chave, _, _, _ in ASSOCIACOES_EDITAVEIS}
+
+MAX_ITENS_BULK = 1000
+
+LOTE_EXCLUSAO = 1000
+
+LOTE_EXPORTACAO = 1000
+
+FORMATOS_EXPORTACAO = {
+
+    'ndjson': 'application/x-ndjson',
+
+    'csv': 'text/csv; charset=utf-8',
+
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+
+}
+
+
+
+def _ids_parametro(args, nome):
+
+    """Lê ids de um parâmetro repetido e/ou separado por vírgulas; levanta ValueError se inválido"""
+
+    valores = []
+
+    for bruto in args.getlist(nome):
+
+        for parte in _lista_parametro(bruto):
+
+            try:
+
+                valores.append(int(parte))
+
+            except ValueError:
+
+                raise ValueError(f"{nome} deve conter ids numéricos")
+
+    return list(dict.fromkeys(valores))
+
+
+
+def _criterio_associacao(modelo, coluna, valores, modo):
+
+    """Credenciados ligados a qualquer (or) ou a todos (and) os ids na tabela de associação"""
+
+    subquery = select(modelo.id_credenciado).where(coluna.in_(valores))
+
+    if modo == 'and' and len(valores) > 1:
+
+        subquery = subquery.group_by(modelo.id_credenciado).having(
+
+            func.count(func.distinct(coluna)) == len(valores)
+
+        )
+
+    return Credenciado.id.in_(subquery)
+
+
+
+def _criterios_listagem(args):
+
+    """Monta os filtros da listagem a partir dos parâmetros da requisição; levanta ValueError se inválidos"""
+
+    nome = args.get('nome')
+
+    status_filter = args.get('status')
+
+    cidade = args.get('cidade')
+
+    tipo = args.get('tipo')
+
+    modo = (args.get('modo') or 'or').lower()
+
+    if modo not in MODOS_FILTRO:
+
+        raise ValueError(f"modo deve ser um de: {', '.join(MODOS_FILTRO)}")
+
+    
+
+    criterios = []
+
+    if nome:
+
+        criterios.append(Credenciado.nome_busca.like(f"%{normalizar_texto(nome)}%"))
+
+    if status_filter:
+
+        criterios.append(Credenciado.status_busca == normalizar_texto(status_filter))
+
+    if cidade:
+
+        criterios.append(Credenciado.cidade_busca.like(f"%{normalizar_texto(cidade)}%"))
+
+    if tipo:
+
+        criterios.append(Credenciado.tipo == tipo)
+
+    
+
+    for parametro, modelo, coluna in FILTROS_ASSOCIACAO:
+
+        valores = _ids_parametro(args, parametro)
+
+        if valores:
+
+            criterios.append(_criterio_associacao(modelo, coluna, valores, modo))
+
+    return criterios
+
+
+
+def _filtros_indice_facetas(args):
+
+    """Filtros no formato do índice de facetas, ou None se a requisição usa filtros fora dele"""
+
+    if any((args.get(p) or '').strip() for p in ('nome', 'cidade', 'tipo', 'q')):
+
+        return None
+
+    filtros = {}
+
+    for parametro, dimensao in (
+
+        ('especialidade_id', 'especialidades'),
+
+        ('rede_id', 'redes'),
+
+        ('diferencial_id', 'diferenciais'),
+
+    ):
+
+        valores = _ids_parametro(args, parametro)
+
+        if valores:
+
+            filtros[dimensao] = valores
+
+    if args.get('status'):
+
+        filtros['status'] = [normalizar_texto(args.get('status'))]
+
+    return filtros
+
+
+
+def _calcular_facetas(db, criterios):
+
+    """Contagens por especialidade, rede, diferencial, status e estado para o filtro atual, só com GROUP BY"""
+
+    filtrados = select(Credenciado.id).where(*criterios)
+
+    facetas = {}
+
+    
+
+    for chave, modelo, coluna, tabela, rotulo in (
+
+        ('especialidades', CredenciadoEspecialidade, CredenciadoEspecialidade.id_especialidade,
+
+         Especialidade, 'descricao'),
+
+        ('redes', CredenciadoRede, CredenciadoRede.id_rede, Rede, 'nome'),
+
+        ('diferenciais', CredenciadoDiferencial, CredenciadoDiferencial.id_diferencial,
+
+         Diferencial, 'descricao'),
+
+    ):
+
+        total = func.count(func.distinct(modelo.id_credenciado))
+
+        rows = db.execute(
+
+            select(tabela.id, getattr(tabela, rotulo), total)
+
+            .join(modelo, coluna == tabela.id)
+
+            .where(modelo.id_credenciado.in_(filtrados))
+
+            .group_by(tabela.id, getattr(tabela, rotulo))
+
+            .order_by(total.desc(), tabela.id)
+
+        ).all()
+
+        facetas[chave] = [{"id": i, rotulo: r, "count": int(n)} for i, r, n in rows]
+
+    
+
+    total = func.count(Credenciado.id)
+
+    rows = db.execute(
+
+        select(func.min(Credenciado.status), total)
+
+        .where(*criterios)
+
+        .group_by(Credenciado.status_busca)
+
+        .order_by(total.desc())
+
+    ).all()
+
+    facetas['status'] = [{"status": r, "count": int(n)} for r, n in rows]
+
+    
+
+    rows = db.execute(
+
+        select(Credenciado.estado, total)
+
+        .where(*criterios)
+
+        .group_by(Credenciado.estado)
+
+        .order_by(total.desc())
+
+    ).all()
+
+    facetas['estados'] = [{"estado": r, "count": int(n)} for r, n in rows]
+
+    return facetas
+
+
+
+def _pagina_ids(db, criterios, skip, limit, ordenacao=None):
+
+    """Primeira fase da listagem: seleciona apenas os ids da página, sem joins"""
+
+    rows = (
+
+        db.query(Credenciado.id)
+
+        .filter(*criterios)
+
+        .order_by(*(ordenacao or [Credenciado.id]))
+
+        .offset(skip)
+
+        .limit(limit)
+
+        .all()
+
+    )
+
+    return [r[0] for r in rows]
+
+
+
+def _codificar_cursor(ordem, chave):
+
+    bruto = json.dumps({"o": ordem, "k": chave}, separators=(',', ':')).encode('utf-8')
+
+    return base64.urlsafe_b64encode(bruto).decode('ascii').rstrip('=')
+
+
+
+def _decodificar_cursor(cursor):
+
+    """Retorna (ordem, chave) de um cursor opaco; levanta ValueError se for inválido"""
+
+    try:
+
+        bruto = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+
+        dados = json.loads(bruto)
+
+        ordem = dados['o']
+
+        chave = dados['k']
+
+    except Exception:
+
+        raise ValueError("cursor inválido")
+
+    if ordem == 'id' and isinstance(chave, list) and len(chave) == 1 and isinstance(chave[0], int):
+
+        return ordem, chave
+
+    if (ordem == 'nome' and isinstance(chave, list) and len(chave) == 2
+
+            and isinstance(chave[0], str) and isinstance(chave[1], int)):
+
+        return ordem, chave
+
+    raise ValueError("cursor inválido")
+
+
+
+def _pagina_ids_cursor(db, criterios, ordem, chave, limit):
+
+    """Primeira fase por keyset: continua após a última chave vista, com custo independente da profundidade"""
+
+    if ordem == 'nome':
+
+        query = db.query(Credenciado.id, Credenciado.nome).filter(*criterios)
+
+        if chave:
+
+            nome, ultimo_id = chave
+
+            query = query.filter(or_(
+
+                Credenciado.nome > nome,
+
+                and_(Credenciado.nome == nome, Credenciado.id > ultimo_id),
+
+            ))
+
+        query = query.order_by(Credenciado.nome, Credenciado.id)
+
+    else:
+
+        query = db.query(Credenciado.id).filter(*criterios)
+
+        if chave:
+
+            query = query.filter(Credenciado.id > chave[0])
+
+        query = query.order_by(Credenciado.id)
+
+    
+
+    rows = query.limit(limit + 1).all()
+
+    proximo = None
+
+    if len(rows) > limit:
+
+        rows = rows[:limit]
+
+        ultimo = rows[-1]
+
+        chave = [ultimo.nome, ultimo.id] if ordem == 'nome' else [ultimo.id]
+
+        proximo = _codificar_cursor(ordem, chave)
+
+    return [r.id for r in rows], proximo
+
+
+
+def _carregar_credenciados(db, ids):
+
+    """Segunda fase: carrega os credenciados dos ids e cada associação em uma consulta IN"""
+
+    if not ids:
+
+        return []
+
+    
+
+    credenciados = db.query(Credenciado).options(
+
+        selectinload(Credenciado.especialidades),
+
+        selectinload(Credenciado.diferenciais),
+
+        selectinload(Credenciado.redes),
+
+        selectinload(Credenciado.complexidades).joinedload(CredenciadoComplexidade.especialidade),
+
+    ).filter(Credenciado.id.in_(ids)).all()
+
+    
+
+    por_id = {c.id: c for c in credenciados}
+
+    return [por_id[i] for i in ids if i in por_id]
+
+
+
+def _serializar_listagem(c):
+
+    return {
+
+        "id": c.id,
+
+        "credenciamento": getattr(c, 'credenciamento', None),
+
+        "nome": c.nome,
+
+        "tipo": c.tipo,
+
+        "status": c.status,
+
+        "cidade": c.cidade,
+
+        "estado": c.estado,
+
+        "telefone": c.telefone,
+
+        "email": c.email,
+
+        
+
+        "tempo_medio_agendamento": getattr(c, 'tempo_medio_agendamento', None),
+
+        "tempo_medio_procedimento": getattr(c, 'tempo_medio_procedimento', None),
+
+        
+
+        "latitude": float(c.latitude) if getattr(c, 'latitude', None) is not None else None,
+
+        "longitude": float(c.longitude) if getattr(c, 'longitude', None) is not None else None,
+
+        "parceiro_estrategico": c.parceiro_estrategico if hasattr(c, 'parceiro_estrategico') else False,
+
+        
+
+        "complexidade": getattr(c, 'complexidade', None),
+
+        
+
+        "especialidades": [
+
+            {"id": e.id, "descricao": e.descricao}
+
+            for e in getattr(c, 'especialidades', [])
+
+        ],
+
+        "diferenciais": [
+
+            {"id": d.id, "descricao": d.descricao}
+
+            for d in getattr(c, 'diferenciais', [])
+
+        ],
+
+        "redes": [
+
+            {"id": r.id, "nome": r.nome}
+
+            for r in getattr(c, 'redes', [])
+
+        ],
+
+        
+
+        "complexidades": [
+
+            {
+
+                "id": cc.id,
+
+                "id_especialidade": cc.id_especialidade,
+
+                "especialidade": getattr(cc.especialidade, 'descricao', None)
+
+            }
+
+            for cc in getattr(c, 'complexidades', [])
+
+        ],
+
+    }
+
+
+
+def _lista_parametro(valor):
+
+    return [v.strip() for v in (valor or '').split(',') if v.strip()]
+
+
+
+def _parametros_projecao(fields, include, padrao=CAMPOS_LISTAGEM):
+
+    """Valida fields/include e retorna (campos, relações); levanta ValueError se inválidos"""
+
+    campos = _lista_parametro(fields) if fields is not None else list(padrao)
+
+    include = _lista_parametro(include)
+
+    invalidos = [c for c in campos if c not in CAMPOS_PROJECAO]
+
+    if invalidos:
+
+        raise ValueError(f"Campos inválidos: {', '.join(invalidos)}")
+
+    invalidos = [r for r in include if r not in RELACOES]
+
+    if invalidos:
+
+        raise ValueError(f"Relações inválidas: {', '.join(invalidos)}. Use: {', '.join(RELACOES)}")
+
+    if 'id' not in campos:
+
+        campos.insert(0, 'id')
+
+    return list(dict.fromkeys(campos)), list(dict.fromkeys(include))
+
+
+
+def _consulta_relacao(rel, ids):
+
+    """Select de uma associação no formato comum (relação, id_credenciado, id, id_especialidade, texto)"""
+
+    sem_especialidade = cast(null(), Integer)
+
+    if rel == 'especialidades':
+
+        return (
+
+            select(literal(rel), CredenciadoEspecialidade.id_credenciado, Especialidade.id,
+
+                   sem_especialidade, Especialidade.descricao)
+
+            .join(Especialidade, Especialidade.id == CredenciadoEspecialidade.id_especialidade)
+
+            .where(CredenciadoEspecialidade.id_credenciado.in_(ids))
+
+        )
+
+    if rel == 'diferenciais':
+
+        return (
+
+            select(literal(rel), CredenciadoDiferencial.id_credenciado, Diferencial.id,
+
+                   sem_especialidade, Diferencial.descricao)
+
+            .join(Diferencial, Diferencial.id == CredenciadoDiferencial.id_diferencial)
+
+            .where(CredenciadoDiferencial.id_credenciado.in_(ids))
+
+        )
+
+    if rel == 'redes':
+
+        return (
+
+            select(literal(rel), CredenciadoRede.id_credenciado, Rede.id,
+
+                   sem_especialidade, Rede.nome)
+
+            .join(Rede, Rede.id == CredenciadoRede.id_rede)
+
+            .where(CredenciadoRede.id_credenciado.in_(ids))
+
+        )
+
+    return (
+
+        select(literal(rel), CredenciadoComplexidade.id_credenciado, CredenciadoComplexidade.id,
+
+               CredenciadoComplexidade.id_especialidade, Especialidade.descricao)
+
+        .outerjoin(Especialidade, Especialidade.id == CredenciadoComplexidade.id_especialidade)
+
+        .where(CredenciadoComplexidade.id_credenciado.in_(ids))
+
+    )
+
+
+
+def _carregar_relacoes(db, ids, include):
+
+    """Carrega as associações pedidas dos ids em uma única consulta (UNION ALL), sem instanciar ORM"""
+
+    relacoes = {rel: {i: [] for i in ids} for rel in include}
+
+    if not ids or not include:
+
+        return relacoes
+
+    
+
+    consultas = [_consulta_relacao(rel, ids) for rel in include]
+
+    consulta = consultas[0] if len(consultas) == 1 else union_all(*consultas)
+
+    for rel, id_credenciado, item_id, id_especialidade, texto in db.execute(consulta):
+
+        if rel == 'complexidades':
+
+            item = {"id": item_id, "id_especialidade": id_especialidade, "especialidade": texto}
+
+        elif rel == 'redes':
+
+            item = {"id": item_id, "nome": texto}
+
+        else:
+
+            item = {"id": item_id, "descricao": texto}
+
+        relacoes[rel][id_credenciado].append(item)
+
+    return relacoes
+
+
+
+def _detalhar_credenciados(db, ids):
+
+    """Carrega credenciados completos (colunas + associações) em duas consultas, na ordem dos ids"""
+
+    return _listar_projecao(db, ids, list(CAMPOS_PROJECAO), list(RELACOES))
+
+
+
+def _valor_json(valor):
+
+    if isinstance(valor, Decimal):
+
+        return float(valor)
+
+    if isinstance(valor, (datetime.date, datetime.datetime)):
+
+        return valor.isoformat()
+
+    return valor
+
+
+
+def _listar_projecao(db, ids, campos, include):
+
+    """Modo projeção: select só das colunas pedidas e apenas das associações incluídas"""
+
+    if not ids:
+
+        return []
+
+    
+
+    colunas = [getattr(Credenciado, campo) for campo in campos]
+
+    rows = db.execute(select(*colunas).where(Credenciado.id.in_(ids))).all()
+
+    por_id = {row.id: row for row in rows}
+
+    relacoes = _carregar_relacoes(db, ids, include)
+
+    
+
+    items = []
+
+    for i in ids:
+
+        row = por_id.get(i)
+
+        if row is None:
+
+            continue
+
+        item = {campo: _valor_json(getattr(row, campo)) for campo in campos}
+
+        for rel in include:
+
+            item[rel] = relacoes[rel][i]
+
+        items.append(item)
+
+    return items
+
+
+
+def _chave_filtros(args):
+
+    """Forma canônica dos filtros da listagem (sem ordem, caixa ou acentos) usada como chave do cache de contagens"""
+
+    chave = [
+
+        (parametro, normalizar_texto(args.get(parametro)))
+
+        for parametro in ('nome', 'status', 'cidade', 'q')
+
+        if (args.get(parametro) or '').strip()
+
+    ]
+
+    if args.get('tipo'):
+
+        chave.append(('tipo', args.get('tipo')))
+
+    multiplos = False
+
+    for parametro, _, _ in FILTROS_ASSOCIACAO:
+
+        valores = _ids_parametro(args, parametro)
+
+        if valores:
+
+            chave.append((parametro, tuple(sorted(valores))))
+
+            multiplos = multiplos or len(valores) > 1
+
+    if multiplos:
+
+        chave.append(('modo', (args.get('modo') or 'or').lower()))
+
+    return tuple(chave)
+
+
+
+def _totais(db, args, criterios, atual=False):
+
+    """(total, última atualização, maior id, soma das versões) dos credenciados que atendem aos filtros;
+    via cache curto de contagens, salvo se atual. Maior id e soma das versões mudam a cada inserção ou escrita,
+    mesmo dentro do mesmo segundo"""
+
+    def calcular():
+
+        return tuple(db.execute(
+
+            select(
+
+                func.count(), func.max(Credenciado.ultima_atualizacao),
+
+                func.max(Credenciado.id), func.sum(Credenciado.versao),
+
+            ).select_from(Credenciado).where(*criterios)
+
+        ).one())
+
+    if atual:
+
+        return calcular()
+
+    return cache_contagens.obter(_chave_filtros(args), calcular)
+
+
+
+def _com_total(resposta, total):
+
+    resposta.headers['X-Total-Count'] = str(total)
+
+    return resposta
+
+
+
+def _etag(*partes):
+
+    """ETag fraco a partir das partes (contagem, ids, versões, datas de atualização)"""
+
+    return '-'.join(
+
+        parte.strftime('%Y%m%d%H%M%S') if isinstance(parte, datetime.datetime) else str(parte)
+
+        for parte in partes
+
+    )
+
+
+
+def _nao_modificado(etag, ultima):
+
+    """True se If-None-Match (ou, na falta dele, If-Modified-Since) ainda corresponde à versão atual"""
+
+    if request.if_none_match:
+
+        return request.if_none_match.contains_weak(etag)
+
+    if request.if_modified_since and ultima is not None:
+
+        return ultima.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None)
+
+    return False
+
+
+
+def _com_validadores(resposta, etag, ultima):
+
+    resposta.set_etag(etag, weak=True)
+
+    if ultima is not None:
+
+        resposta.last_modified = ultima
+
+    return resposta
+
+
+
+@credenciados_bp.route('/', methods=['GET'])
+
+def listar_credenciados():
+
+    """Lista todos os credenciados com filtros opcionais"""
+
+    db = get_db()
+
+    
+
+    skip = request.args.get('skip', 0, type=int)
+
+    limit = request.args.get('limit', 100, type=int)
+
+    cursor = request.args.get('cursor')
+
+    if cursor is not None and limit < 1:
+
+        return jsonify({"error": "limit deve ser maior que zero na paginação por cursor"}), 400
+
+    
+
+    fields = request.args.get('fields')
+
+    include = request.args.get('include')
+
+    
+
+    projecao = fields is not None or include is not None
+
+    if projecao:
+
+        try:
+
+            campos, include = _parametros_projecao(fields, include)
+
+        except ValueError as e:
+
+            return jsonify({"error": str(e)}), 400
+
+    
+
+    q = (request.args.get('q') or '').strip()
+
+    facets = request.args.get('facets', '').lower() in ('1', 'true', 'sim')
+
+    
+
+    try:
+
+        criterios = _criterios_listagem(request.args)
+
+    except ValueError as e:
+
+        return jsonify({"error": str(e)}), 400
+
+    
+
+    ordenacao = None
+
+    if q:
+
+        if cursor is not None:
+
+            return jsonify({"error": "A busca por relevância (q) usa skip/limit, não cursor"}), 400
+
+        criterio, ordenacao = criterio_busca(db, q)
+
+        criterios.append(criterio)
+
+    
+
+    condicional = bool(request.if_none_match or request.if_modified_since)
+
+    total, ultima, maior_id, versoes = _totais(db, request.args, criterios, atual=condicional)
+
+    etag = _etag(total, maior_id, versoes, ultima)
+
+    if _nao_modificado(etag, ultima):
+
+        return _com_total(_com_validadores(Response(status=304), etag, ultima), total)
+
+    
+
+    next_cursor = None
+
+    if q:
+
+        ids = _pagina_ids(db, criterios, skip, limit, ordenacao)
+
+    elif cursor is None:
+
+        ids = _pagina_ids(db, criterios, skip, limit)
+
+    else:
+
+        ordem = request.args.get('ordem', 'id')
+
+        chave = None
+
+        if cursor:
+
+            try:
+
+                ordem, chave = _decodificar_cursor(cursor)
+
+            except ValueError:
+
+                return jsonify({"error": "Cursor inválido"}), 400
+
+        elif ordem not in ORDENACOES_CURSOR:
+
+            return jsonify({"error": f"Ordenação inválida. Use: {', '.join(sorted(ORDENACOES_CURSOR))}"}), 400
+
+        ids, next_cursor = _pagina_ids_cursor(db, criterios, ordem, chave, limit)
+
+    
+
+    if projecao:
+
+        items = _listar_projecao(db, ids, campos, include)
+
+    else:
+
+        items = [_serializar_listagem(c) for c in _carregar_credenciados(db, ids)]
+
+    
+
+    if (cursor is None or q) and not facets:
+
+        return _com_total(_com_validadores(jsonify(items), etag, ultima), total), 200
+
+    
+
+    resposta = {"items": items}
+
+    if cursor is not None and not q:
+
+        resposta["next_cursor"] = next_cursor
+
+    if facets:
+
+        filtros = _filtros_indice_facetas(request.args) if indice_facetas.carregado else None
+
+        if filtros is not None:
+
+            resposta["facets"] = indice_facetas.facetas(filtros, (request.args.get('modo') or 'or').lower())
+
+        else:
+
+            resposta["facets"] = _calcular_facetas(db, criterios)
+
+    return _com_total(_com_validadores(jsonify(resposta), etag, ultima), total), 200
+
+
+
+def _texto_relacao(rel, itens):
+
+    """Associações de uma célula CSV: nomes/descrições separados por '; '"""
+
+    chave = 'especialidade' if rel == 'complexidades' else 'nome' if rel == 'redes' else 'descricao'
+
+    return '; '.join(str(item[chave] or '') for item in itens)
+
+
+
+def _exportar_xlsx(criterios):
+
+    """Planilha no layout de upload_arquivo, escrita em modo write-only (memória constante) num arquivo temporário"""
+
+    consulta = (
+
+        select(*[getattr(Credenciado, coluna) for coluna in COLUNAS_PLANILHA])
+
+        .where(*criterios).order_by(Credenciado.id)
+
+    )
+
+    workbook = Workbook(write_only=True)
+
+    planilha = workbook.create_sheet('credenciados')
+
+    planilha.append(COLUNAS_PLANILHA)
+
+    with engine.connect() as conn:
+
+        resultado = conn.execution_options(stream_results=True, yield_per=LOTE_EXPORTACAO).execute(consulta)
+
+        for linha in resultado:
+
+            planilha.append([
+
+                ILLEGAL_CHARACTERS_RE.sub('', valor) if isinstance(valor, str) else valor for valor in linha
+
+            ])
+
+    
+
+    arquivo = tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False)
+
+    arquivo.close()
+
+    workbook.save(arquivo.name)
+
+    resposta = send_file(
+
+        arquivo.name,
+
+        mimetype=FORMATOS_EXPORTACAO['xlsx'],
+
+        as_attachment=True,
+
+        download_name='credenciados.xlsx',
+
+    )
+
+    resposta.call_on_close(lambda: os.remove(arquivo.name))
+
+    return resposta
+
+
+
+@credenciados_bp.route('/export', methods=['GET'])
+
+def exportar_credenciados():
+
+    """Exporta os credenciados filtrados (mesmos filtros da listagem) em NDJSON ou CSV, em streaming, ou XLSX"""
+
+    formato = (request.args.get('format') or 'ndjson').lower()
+
+    if formato not in FORMATOS_EXPORTACAO:
+
+        return jsonify({"error": f"Formato inválido. Use: {', '.join(FORMATOS_EXPORTACAO)}"}), 400
+
+    try:
+
+        campos, include = _parametros_projecao(
+
+            request.args.get('fields'), request.args.get('include'), padrao=CAMPOS_PROJECAO
+
+        )
+
+        criterios = _criterios_listagem(request.args)
+
+    except ValueError as e:
+
+        return jsonify({"error": str(e)}), 400
+
+    
+
+    db = get_db()
+
+    q = (request.args.get('q') or '').strip()
+
+    if q:
+
+        criterio, _ = criterio_busca(db, q)
+
+        criterios.append(criterio)
+
+    if formato == 'xlsx':
+
+        return _exportar_xlsx(criterios)
+
+    consulta = select(*[getattr(Credenciado, campo) for campo in campos]).where(*criterios).order_by(Credenciado.id)
+
+    
+
+    def gerar():
+
+        buffer = io.StringIO()
+
+        escritor = csv.writer(buffer)
+
+        if formato == 'csv':
+
+            escritor.writerow(campos + include)
+
+        with engine.connect() as conn:
+
+            resultado = conn.execution_options(stream_results=True, yield_per=LOTE_EXPORTACAO).execute(consulta)
+
+            for linhas in resultado.partitions():
+
+                relacoes = _carregar_relacoes(db, [linha.id for linha in linhas], include)
+
+                for linha in linhas:
+
+                    valores = [_valor_json(valor) for valor in linha]
+
+                    if formato == 'csv':
+
+                        escritor.writerow(valores + [_texto_relacao(rel, relacoes[rel][linha.id]) for rel in include])
+
+                    else:
+
+                        item = dict(zip(campos, valores))
+
+                        for rel in include:
+
+                            item[rel] = relacoes[rel][linha.id]
+
+                        buffer.write(json.dumps(item, ensure_ascii=False) + '\n')
+
+                yield buffer.getvalue()
+
+                buffer.seek(0)
+
+                buffer.truncate()
+
+        if buffer.tell():
+
+            yield buffer.getvalue()
+
+    
+
+    return Response(
+
+        stream_with_context(gerar()),
+
+        content_type=FORMATOS_EXPORTACAO[formato],
+
+        headers={"Content-Disposition": f"attachment; filename=credenciados.{formato}"},
+
+    )
+
+
+
+@credenciados_bp.route('/changes', methods=['GET'])
+
+def alteracoes_credenciados():
+
+    """Credenciados criados/alterados e ids excluídos desde ?since=<token> (sem token: carga completa)"""
+
+    limit = request.args.get('limit', 1000, type=int)
+
+    if not (0 < limit <= MAX_ALTERACOES):
+
+        return jsonify({"error": f"limit deve estar entre 1 e {MAX_ALTERACOES}"}), 400
+
+    try:
+
+        campos, include = _parametros_projecao(
+
+            request.args.get('fields'), request.args.get('include'), padrao=CAMPOS_PROJECAO
+
+        )
+
+    except ValueError as e:
+
+        return jsonify({"error": str(e)}), 400
+
+    
+
+    db = get_db()
+
+    token = request.args.get('since') or token_inicial(db)
+
+    try:
+
+        ids, excluidos, next_token, has_more = alteracoes_desde(db, token, limit)
+
+    except ValueError as e:
+
+        return jsonify({"error": str(e)}), 400
+
+    
+
+    return jsonify({
+
+        "items": _listar_projecao(db, ids, campos, include),
+
+        "deleted": excluidos,
+
+        "next_token": next_token,
+
+        "has_more": has_more,
+
+    }), 200
+
+
+
+@credenciados_bp.route('/outbox', methods=['GET'])
+
+def eventos_credenciados():
+
+    """Eventos do outbox de credenciados com id > ?after, em lotes (?limit)"""
+
+    cargo = (session.get('cargo') or '').lower()
+
+    if cargo not in {"admin", "ti", "ceo"}:
+
+        return jsonify({"error": "Sem permissão para ler o outbox"}), 403
+
+    after = request.args.get('after', 0, type=int)
+
+    limit = request.args.get('limit', LOTE_EVENTOS, type=int)
+
+    if not (0 < limit <= MAX_ALTERACOES):
+
+        return jsonify({"error": f"limit deve estar entre 1 e {MAX_ALTERACOES}"}), 400
+
+    
+
+    eventos = ler_eventos(get_db(), after, limit)
+
+    return jsonify({
+
+        "items": eventos,
+
+        "next_after": eventos[-1]["id"] if eventos else after,
+
+    }), 200
+
+
+
+@credenciados_bp.route('/nearby', methods=['GET'])
+
+def credenciados_proximos():
+
+    """Lista credenciados em um raio (km) de um ponto, ordenados pela distância"""
+
+    lat = request.args.get('lat', type=float)
+
+    lng = request.args.get('lng', type=float)
+
+    raio_km = request.args.get('radius_km', 10.0, type=float)
+
+    especialidade_id = request.args.get('especialidade', type=int)
+
+    limit = request.args.get('limit', 100, type=int)
+
+    
+
+    if lat is None or lng is None:
+
+        return jsonify({"error": "Parâmetros lat e lng são obrigatórios"}), 400
+
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+
+        return jsonify({"error": "Coordenadas inválidas"}), 400
+
+    if not (0 < raio_km <= RAIO_MAXIMO_KM):
+
+        return jsonify({"error": f"radius_km deve estar entre 0 e {RAIO_MAXIMO_KM}"}), 400
+
+    try:
+
+        campos, include = _parametros_projecao(request.args.get('fields'), request.args.get('include'))
+
+    except ValueError as e:
+
+        return jsonify({"error": str(e)}), 400
+
+    
+
+    db = get_db()
+
+    lat_min, lat_max, lng_min, lng_max = caixa_delimitadora(lat, lng, raio_km)
+
+    
+
+    query = select(Credenciado.id, Credenciado.latitude, Credenciado.longitude).where(
+
+        Credenciado.latitude.between(lat_min, lat_max),
+
+        Credenciado.longitude.isnot(None),
+
+    )
+
+    if lng_min < -180:
+
+        query = query.where(or_(Credenciado.longitude >= lng_min + 360, Credenciado.longitude <= lng_max))
+
+    elif lng_max > 180:
+
+        query = query.where(or_(Credenciado.longitude >= lng_min, Credenciado.longitude <= lng_max - 360))
+
+    else:
+
+        query = query.where(Credenciado.longitude.between(lng_min, lng_max))
+
+    if especialidade_id is not None:
+
+        query = query.where(Credenciado.id.in_(
+
+            select(CredenciadoEspecialidade.id_credenciado)
+
+            .where(CredenciadoEspecialidade.id_especialidade == especialidade_id)
+
+        ))
+
+    
+
+    candidatos = db.execute(query).all()
+
+    if not candidatos:
+
+        return jsonify([]), 200
+
+    
+
+    ids = np.fromiter((row[0] for row in candidatos), dtype=np.int64, count=len(candidatos))
+
+    lats = np.fromiter((float(row[1]) for row in candidatos), dtype=np.float64, count=len(candidatos))
+
+    lngs = np.fromiter((float(row[2]) for row in candidatos), dtype=np.float64, count=len(candidatos))
+
+    distancias = haversine_km(lat, lng, lats, lngs)
+
+    
+
+    dentro = np.flatnonzero(distancias <= raio_km)
+
+    ordem = dentro[np.argsort(distancias[dentro], kind='stable')][:max(limit, 0)]
+
+    
+
+    items = _listar_projecao(db, [int(i) for i in ids[ordem]], campos, include)
+
+    for item, d in zip(items, distancias[ordem]):
+
+        item["distancia_km"] = round(float(d), 3)
+
+    return jsonify(items), 200
+
+
+
+@credenciados_bp.route('/clusters', methods=['GET'])
+
+def clusters_credenciados():
+
+    """Agrupa credenciados em células de grade do zoom, para o mapa"""
+
+    zoom = request.args.get('zoom', type=int)
+
+    bbox = request.args.get('bbox', '-180,-90,180,90')
+
+    
+
+    if zoom is None or not (0 <= zoom <= ZOOM_MAXIMO):
+
+        return jsonify({"error": f"zoom deve estar entre 0 e {ZOOM_MAXIMO}"}), 400
+
+    try:
+
+        lng_min, lat_min, lng_max, lat_max = (float(v) for v in bbox.split(','))
+
+    except ValueError:
+
+        return jsonify({"error": "bbox deve ser lng_min,lat_min,lng_max,lat_max"}), 400
+
+    if lat_min > lat_max:
+
+        return jsonify({"error": "bbox deve ser lng_min,lat_min,lng_max,lat_max"}), 400
+
+    
+
+    db = get_db()
+
+    clusters = cache_clusters.clusters(db, zoom, (lng_min, lat_min, lng_max, lat_max))
+
+    return jsonify({
+
+        "zoom": zoom,
+
+        "total": sum(c["count"] for c in clusters),
+
+        "clusters": clusters,
+
+    }), 200
+
+
+
+@credenciados_bp.route('/batch', methods=['GET', 'POST'])
+
+def obter_credenciados_lote():
+
+    """Obtém vários credenciados por ID (GET ?ids=1,2,3 ou POST {"ids": [...]}) no formato de obter_credenciado"""
+
+    if request.method == 'POST':
+
+        data = request.get_json(silent=True) or {}
+
+        brutos = data.get('ids')
+
+        if not isinstance(brutos, list):
+
+            return jsonify({"error": "Envie {\"ids\": [...]}"}), 400
+
+    else:
+
+        brutos = _lista_parametro(request.args.get('ids'))
+
+    
+
+    try:
+
+        ids = list(dict.fromkeys(int(i) for i in brutos))
+
+    except (TypeError, ValueError):
+
+        return jsonify({"error": "ids deve conter apenas números"}), 400
+
+    if not ids:
+
+        return jsonify({"error": "Informe ao menos um id"}), 400
+
+    if len(ids) > MAX_IDS_LOTE:
+
+        return jsonify({"error": f"Máximo de {MAX_IDS_LOTE} ids por requisição"}), 400
+
+    
+
+    db = get_db()
+
+    items = _detalhar_credenciados(db, ids)
+
+    encontrados = {item["id"] for item in items}
+
+    
+
+    return jsonify({
+
+        "items": items,
+
+        "nao_encontrados": [i for i in ids if i not in encontrados],
+
+    }), 200
+
+
+
+@credenciados_bp.route('/', methods=['POST'])
+
+def criar_credenciado():
+
+    """Cria um novo credenciado"""
+
+    
+
+    cargo = (session.get('cargo') or '').lower()
+
+    if cargo not in {"admin", "credenciamento", "ti", "ceo"}:
+
+        return jsonify({"error": "Sem permissão para criar"}), 403
+
+    data = request.get_json()
+
+    
+
+    if not data or not data.get('nome'):
+
+        return jsonify({"error": "Nome é obrigatório"}), 400
+
+    
+
+    db = get_db()
+
+    
+
+    especialidades_ids = data.pop('especialidades_ids', [])
+
+    diferenciais_ids = data.pop('diferenciais_ids', [])
+
+    redes_ids = data.pop('redes_ids', [])
+
+    complexidades_especialidades_ids = data.pop('complexidades_especialidades_ids', [])
+
+    
+
+    db_credenciado = Credenciado(**data)
+
+    db.add(db_credenciado)
+
+    db.flush()
+
+    
+
+    for esp_id in especialidades_ids:
+
+        db.add(CredenciadoEspecialidade(
+
+            id_credenciado=db_credenciado.id,
+
+            id_especialidade=esp_id
+
+        ))
+
+    
+
+    for dif_id in diferenciais_ids:
+
+        db.add(CredenciadoDiferencial(
+
+            id_credenciado=db_credenciado.id,
+
+            id_diferencial=dif_id
+
+        ))
+
+    
+
+    for rede_id in redes_ids:
+
+        db.add(CredenciadoRede(
+
+            id_credenciado=db_credenciado.id,
+
+            id_rede=rede_id
+
+        ))
+
+    
+
+    for esp_id in complexidades_especialidades_ids:
+
+        db.add(CredenciadoComplexidade(
+
+            id_credenciado=db_credenciado.id,
+
+            id_especialidade=esp_id,
+
+            id_credenciamento=None
+
+        ))
+
+    
+
+    registrar_eventos(db, [('insert', db_credenciado.id, None)])
+
+    db.commit()
+
+    db.refresh(db_credenciado)
+
+    notificar_alteracao(db, [db_credenciado.id])
+
+    
+
+    return jsonify({
+
+        "message": "Credenciado criado com sucesso",
+
+        "id": db_credenciado.id
+
+    }), 201
+
+
+
+def _itens_bulk(data):
+
+    """Extrai o array de itens do corpo (lista ou {"items": [...]}); levanta ValueError se inválido"""
+
+    itens = data.get('items') if isinstance(data, dict) else data
+
+    if not isinstance(itens, list) or not itens:
+
+        raise ValueError("Envie uma lista não vazia de credenciados")
+
+    if len(itens) > MAX_ITENS_BULK:
+
+        raise ValueError(f"Máximo de {MAX_ITENS_BULK} credenciados por requisição")
+
+    return itens
+
+
+
+def _validar_itens(itens, esquema):
+
+    """Valida cada item com o schema; retorna [(índice, campos enviados)] e {índice: erros}"""
+
+    validos, erros = [], {}
 
-from models import (
+    for indice, item in enumerate(itens):
 
-    Credenciado, CredenciadoEspecialidade, CredenciadoDiferencial, CredenciadoRede, CredenciadoComplexidade
+        try:
 
-)
+            dados = esquema.model_validate(item).model_dump(exclude_unset=True)
 
+        except ValidationError as e:
 
+            erros[indice] = [
 
-credenciados_bp = Blueprint('credenciados', __name__)
+                f"{'.'.join(str(parte) for parte in erro['loc'])}: {erro['msg']}" for erro in e.errors()
 
+            ]
 
+            continue
 
-@credenciados_bp.route('/', methods=['GET'])
+        if 'nome' in dados and not (dados['nome'] or '').strip():
 
-def listar_credenciados():
+            erros[indice] = ["nome: Nome é obrigatório"]
 
-    """Lista todos os credenciados com filtros opcionais"""
+            continue
 
-    db = get_db()
+        validos.append((indice, dados))
 
-    
+    return validos, erros
 
-    skip = request.args.get('skip', 0, type=int)
 
-    limit = request.args.get('limit', 100, type=int)
 
-    
+def _referencias_inexistentes(db, validos):
 
-    nome = request.args.get('nome')
+    """Erros por índice para itens que citam especialidades, diferenciais ou redes que não existem"""
 
-    status_filter = request.args.get('status')
+    pedidos = {}
 
-    cidade = request.args.get('cidade')
+    for _, dados in validos:
 
-    tipo = request.args.get('tipo')
+        for chave, _, _, referencia in ASSOCIACOES_EDITAVEIS:
 
-    
+            pedidos.setdefault(referencia, set()).update(dados.get(chave) or ())
 
-    
+    consultas = [
+
+        select(literal(referencia.__tablename__).label('tabela'), referencia.id).where(referencia.id.in_(ids))
 
-    query = db.query(Credenciado).options(
+        for referencia, ids in pedidos.items() if ids
 
-        joinedload(Credenciado.especialidades),
+    ]
 
-        joinedload(Credenciado.diferenciais),
+    existentes = {}
 
-        joinedload(Credenciado.redes),
+    if consultas:
 
-        joinedload(Credenciado.complexidades).joinedload(CredenciadoComplexidade.especialidade),
+        consulta = consultas[0] if len(consultas) == 1 else union_all(*consultas)
 
-    )
+        for tabela, item_id in db.execute(consulta):
+
+            existentes.setdefault(tabela, set()).add(item_id)
 
     
 
-    if nome:
+    erros = {}
 
-        query = query.filter(Credenciado.nome.ilike(f"%{nome}%"))
+    for indice, dados in validos:
 
-    if status_filter:
+        for chave, _, _, referencia in ASSOCIACOES_EDITAVEIS:
 
-        query = query.filter(Credenciado.status == status_filter)
+            faltando = sorted(set(dados.get(chave) or ()) - existentes.get(referencia.__tablename__, set()))
 
-    if cidade:
+            if faltando:
 
-        query = query.filter(Credenciado.cidade.ilike(f"%{cidade}%"))
+                erros.setdefault(indice, []).append(f"{chave}: ids inexistentes {faltando}")
 
-    if tipo:
+    return erros
 
-        query = query.filter(Credenciado.tipo == tipo)
 
-    
 
-    credenciados = query.offset(skip).limit(limit).all()
+def _resposta_bulk(resultados, total_gravados, chave_total, status_sucesso):
 
-    
+    """Resposta dos endpoints bulk: resultados por item na ordem do lote e totais"""
 
-    return jsonify([{
+    resultados.sort(key=lambda r: r['index'])
 
-        "id": c.id,
+    erros = sum(1 for r in resultados if r['status'] not in ('created', 'updated'))
 
-        "credenciamento": getattr(c, 'credenciamento', None),
+    return jsonify({
 
-        "nome": c.nome,
+        chave_total: total_gravados,
 
-        "tipo": c.tipo,
+        "errors": erros,
 
-        "status": c.status,
+        "results": resultados,
 
-        "cidade": c.cidade,
+    }), status_sucesso if total_gravados else 400
 
-        "estado": c.estado,
 
-        "telefone": c.telefone,
 
-        "email": c.email,
+@credenciados_bp.route('/bulk', methods=['POST'])
 
-        
+def criar_credenciados_lote():
 
-        "tempo_medio_agendamento": getattr(c, 'tempo_medio_agendamento', None),
+    """Cria vários credenciados em uma transação, com um INSERT em lote (executemany); os ids são lidos de volta
+    pela marca lote_criacao, na ordem de inserção"""
 
-        "tempo_medio_procedimento": getattr(c, 'tempo_medio_procedimento', None),
+    cargo = (session.get('cargo') or '').lower()
 
-        
+    if cargo not in {"admin", "credenciamento", "ti", "ceo"}:
 
-        "latitude": float(c.latitude) if getattr(c, 'latitude', None) is not None else None,
+        return jsonify({"error": "Sem permissão para criar"}), 403
 
-        "longitude": float(c.longitude) if getattr(c, 'longitude', None) is not None else None,
+    try:
 
-        "parceiro_estrategico": c.parceiro_estrategico if hasattr(c, 'parceiro_estrategico') else False,
+        itens = _itens_bulk(request.get_json(silent=True))
 
-        
+    except ValueError as e:
 
-        "complexidade": getattr(c, 'complexidade', None),
+        return jsonify({"error": str(e)}), 400
 
-        
+    
 
-        "especialidades": [
+    db = get_db()
 
-            {"id": e.id, "descricao": e.descricao}
+    validos, erros = _validar_itens(itens, CredenciadoCreate)
 
-            for e in getattr(c, 'especialidades', [])
+    erros.update(_referencias_inexistentes(db, validos))
 
-        ],
+    validos = [(indice, dados) for indice, dados in validos if indice not in erros]
 
-        "diferenciais": [
+    
 
-            {"id": d.id, "descricao": d.descricao}
+    validos.sort(key=lambda item: sorted(campo for campo in item[1] if campo not in CHAVES_ASSOCIACAO))
 
-            for d in getattr(c, 'diferenciais', [])
+    lote = uuid.uuid4().hex
 
-        ],
+    linhas = []
 
-        "redes": [
+    for _, dados in validos:
 
-            {"id": r.id, "nome": r.nome}
+        campos = {campo: valor for campo, valor in dados.items() if campo not in CHAVES_ASSOCIACAO}
 
-            for r in getattr(c, 'redes', [])
+        campos.update(campos_busca({campo: campos.get(campo) for campo in CAMPOS_BUSCA}), lote_criacao=lote)
 
-        ],
+        linhas.append(campos)
 
-        
+    ids = []
 
-        "complexidades": [
+    try:
 
-            {
+        if linhas:
 
-                "id": cc.id,
+            db.execute(insert(Credenciado), linhas)
 
-                "id_especialidade": cc.id_especialidade,
+            ids = list(db.scalars(
 
-                "especialidade": getattr(cc.especialidade, 'descricao', None)
+                select(Credenciado.id).where(Credenciado.lote_criacao == lote).order_by(Credenciado.id)
 
-            }
+            ))
 
-            for cc in getattr(c, 'complexidades', [])
+        adicionar = {}
 
-        ],
+        for (_, dados), credenciado_id in zip(validos, ids):
 
-    } for c in credenciados]), 200
+            for chave in CHAVES_ASSOCIACAO:
 
+                adicionar.setdefault(chave, []).extend(
 
+                    (credenciado_id, valor) for valor in dict.fromkeys(dados.get(chave) or ())
 
-@credenciados_bp.route('/', methods=['POST'])
+                )
 
-def criar_credenciado():
+        _gravar_associacoes(db, {}, adicionar)
 
-    """Cria um novo credenciado"""
+        registrar_eventos(db, [('insert', credenciado_id, None) for credenciado_id in ids])
+
+        db.commit()
+
+    except Exception as e:
+
+        db.rollback()
+
+        print(f"[v0] ✗ ERRO no lote de criação: {str(e)}")
+
+        return jsonify({"error": f"Erro ao gravar o lote: {str(e)}"}), 500
+
+    
+
+    if ids:
+
+        notificar_alteracao(db, ids)
 
     
 
+    resultados = [{"index": indice, "status": "error", "errors": mensagens} for indice, mensagens in erros.items()]
+
+    resultados.extend(
+
+        {"index": indice, "status": "created", "id": credenciado_id}
+
+        for (indice, _), credenciado_id in zip(validos, ids)
+
+    )
+
+    return _resposta_bulk(resultados, len(ids), "created", 201)
+
+
+
+@credenciados_bp.route('/bulk', methods=['PATCH'])
+
+def atualizar_credenciados_lote():
+
+    """Atualiza vários credenciados em uma transação, com updates em lote por id"""
+
     cargo = (session.get('cargo') or '').lower()
 
     if cargo not in {"admin", "credenciamento", "ti", "ceo"}:
 
-        return jsonify({"error": "Sem permissão para criar"}), 403
+        return jsonify({"error": "Sem permissão para editar"}), 403
 
-    data = request.get_json()
+    try:
 
-    
+        itens = _itens_bulk(request.get_json(silent=True))
 
-    if not data or not data.get('nome'):
+    except ValueError as e:
 
-        return jsonify({"error": "Nome é obrigatório"}), 400
+        return jsonify({"error": str(e)}), 400
 
     
 
     db = get_db()
 
-    
+    validos, erros = _validar_itens(itens, CredenciadoBulkUpdate)
 
-    especialidades_ids = data.pop('especialidades_ids', [])
+    vistos = set()
 
-    diferenciais_ids = data.pop('diferenciais_ids', [])
+    for indice, dados in validos:
 
-    redes_ids = data.pop('redes_ids', [])
+        if dados['id'] in vistos:
 
-    complexidades_especialidades_ids = data.pop('complexidades_especialidades_ids', [])
+            erros[indice] = [f"id: credenciado {dados['id']} repetido no lote"]
+
+        vistos.add(dados['id'])
+
+    erros.update(_referencias_inexistentes(db, validos))
+
+    validos = [(indice, dados) for indice, dados in validos if indice not in erros]
 
     
 
-    db_credenciado = Credenciado(**data)
+    existentes = set(db.scalars(
 
-    db.add(db_credenciado)
+        select(Credenciado.id).where(Credenciado.id.in_([dados['id'] for _, dados in validos]))
 
-    db.flush()
+    )) if validos else set()
 
-    
+    resultados = [{"index": indice, "status": "error", "errors": mensagens} for indice, mensagens in erros.items()]
 
-    for esp_id in especialidades_ids:
+    resultados.extend(
 
-        db.add(CredenciadoEspecialidade(
+        {"index": indice, "status": "not_found", "id": dados['id']}
 
-            id_credenciado=db_credenciado.id,
+        for indice, dados in validos if dados['id'] not in existentes
 
-            id_especialidade=esp_id
+    )
 
-        ))
+    validos = [(indice, dados) for indice, dados in validos if dados['id'] in existentes]
 
     
 
-    for dif_id in diferenciais_ids:
+    linhas, associacoes = [], {}
 
-        db.add(CredenciadoDiferencial(
+    for _, dados in validos:
 
-            id_credenciado=db_credenciado.id,
+        campos = {campo: valor for campo, valor in dados.items() if campo not in CHAVES_ASSOCIACAO}
 
-            id_diferencial=dif_id
+        if len(campos) > 1:
 
-        ))
+            linhas.append({**campos, **campos_busca(campos)})
 
-    
+        enviadas = {chave: dados[chave] for chave in CHAVES_ASSOCIACAO if dados.get(chave) is not None}
 
-    for rede_id in redes_ids:
+        if enviadas:
 
-        db.add(CredenciadoRede(
+            associacoes[dados['id']] = enviadas
 
-            id_credenciado=db_credenciado.id,
+    try:
 
-            id_rede=rede_id
+        if linhas:
 
-        ))
+            db.execute(update(Credenciado), linhas)
 
-    
+        alterados = _sincronizar_associacoes(db, associacoes)
 
-    for esp_id in complexidades_especialidades_ids:
+        if alterados:
 
-        db.add(CredenciadoComplexidade(
+            db.execute(
 
-            id_credenciado=db_credenciado.id,
+                update(Credenciado).where(Credenciado.id.in_(alterados))
 
-            id_especialidade=esp_id,
+                .values(ultima_atualizacao=func.now()).execution_options(synchronize_session=False)
 
-            id_credenciamento=None
+            )
 
-        ))
+        registrar_eventos(db, [
 
-    
+            ('update', dados['id'], [campo for campo in dados if campo != 'id']) for _, dados in validos
 
-    db.commit()
+        ])
 
-    db.refresh(db_credenciado)
+        db.commit()
+
+    except Exception as e:
+
+        db.rollback()
+
+        print(f"[v0] ✗ ERRO no lote de atualização: {str(e)}")
+
+        return jsonify({"error": f"Erro ao gravar o lote: {str(e)}"}), 500
 
     
 
-    return jsonify({
+    ids = [dados['id'] for _, dados in validos]
 
-        "message": "Credenciado criado com sucesso",
+    if ids:
 
-        "id": db_credenciado.id
+        notificar_alteracao(db, ids)
 
-    }), 201
+    
+
+    resultados.extend({"index": indice, "status": "updated", "id": dados['id']} for indice, dados in validos)
+
+    return _resposta_bulk(resultados, len(ids), "updated", 200)
 
 
 
@@ -288,127 +2003,127 @@ def obter_credenciado(credenciado_id):
 
     db = get_db()
 
-    credenciado = db.query(Credenciado).options(
+    if request.if_none_match or request.if_modified_since:
 
-        joinedload(Credenciado.complexidades).joinedload(CredenciadoComplexidade.especialidade)
+        linha = db.execute(
 
-    ).filter(Credenciado.id == credenciado_id).first()
+            select(Credenciado.ultima_atualizacao, Credenciado.versao).where(Credenciado.id == credenciado_id)
 
-    
+        ).first()
 
-    if not credenciado:
+        if linha is not None:
 
-        return jsonify({"error": "Credenciado não encontrado"}), 404
+            etag = _etag(credenciado_id, linha.versao, linha.ultima_atualizacao)
 
-    
+            if _nao_modificado(etag, linha.ultima_atualizacao):
 
-    
+                return _com_validadores(Response(status=304), etag, linha.ultima_atualizacao)
 
-    lat = float(credenciado.latitude) if credenciado.latitude is not None else None
+    
 
-    lng = float(credenciado.longitude) if credenciado.longitude is not None else None
+    credenciados = _listar_projecao(db, [credenciado_id], list(CAMPOS_PROJECAO) + ['versao'], list(RELACOES))
 
     
 
-    
+    if not credenciados:
+
+        return jsonify({"error": "Credenciado não encontrado"}), 404
 
-    especialidades = [
+    
 
-        {"id": e.id, "descricao": e.descricao}
+    versao = credenciados[0].pop('versao')
 
-        for e in getattr(credenciado, 'especialidades', [])
+    ultima = credenciados[0]['ultima_atualizacao']
 
-    ]
+    ultima = datetime.datetime.fromisoformat(ultima) if ultima else None
 
-    diferenciais = [
+    return _com_validadores(jsonify(credenciados[0]), _etag(credenciado_id, versao, ultima), ultima), 200
 
-        {"id": d.id, "descricao": d.descricao}
 
-        for d in getattr(credenciado, 'diferenciais', [])
 
-    ]
+def _gravar_associacoes(db, remover, adicionar):
 
-    redes = [
+    """Remove e insere pares (credenciado, id) por chave de associação, um statement por tabela"""
 
-        {"id": r.id, "nome": r.nome}
+    for chave, modelo, coluna, _ in ASSOCIACOES_EDITAVEIS:
 
-        for r in getattr(credenciado, 'redes', [])
+        if remover.get(chave):
 
-    ]
+            db.execute(delete(modelo).where(
 
-    complexidades = [
+                tuple_(modelo.id_credenciado, getattr(modelo, coluna)).in_(remover[chave])
 
-        {
+            ).execution_options(synchronize_session=False))
 
-            "id": cc.id,
+        if adicionar.get(chave):
 
-            "id_especialidade": cc.id_especialidade,
+            db.execute(insert(modelo), [
 
-            "especialidade": getattr(cc.especialidade, 'descricao', None)
+                {"id_credenciado": credenciado_id, coluna: valor} for credenciado_id, valor in adicionar[chave]
 
-        }
+            ])
 
-        for cc in getattr(credenciado, 'complexidades', [])
 
-    ]
 
+def _sincronizar_associacoes(db, associacoes):
 
+    """Aplica só a diferença entre os ids associados e os enviados ({credenciado_id: {chave: ids}}); retorna os credenciados alterados"""
 
-    return jsonify({
+    chaves = {chave for enviadas in associacoes.values() for chave in enviadas}
 
-        "id": credenciado.id,
+    editaveis = [item for item in ASSOCIACOES_EDITAVEIS if item[0] in chaves]
 
-        "credenciamento": getattr(credenciado, 'credenciamento', None),
+    if not editaveis:
 
-        "nome": credenciado.nome,
+        return set()
 
-        "tipo": credenciado.tipo,
+    ids = list(associacoes)
 
-        "status": credenciado.status,
+    consultas = [
 
-        "complexidade": credenciado.complexidade,
+        select(literal(chave).label('chave'), modelo.id_credenciado, getattr(modelo, coluna).label('valor'))
 
-        "crm": credenciado.crm,
+        .where(modelo.id_credenciado.in_(ids))
 
-        "logradouro": credenciado.logradouro,
+        for chave, modelo, coluna, _ in editaveis
 
-        "numero": credenciado.numero,
+    ]
 
-        "bairro": credenciado.bairro,
+    consulta = consultas[0] if len(consultas) == 1 else union_all(*consultas)
 
-        "cidade": credenciado.cidade,
+    atuais = {}
 
-        "estado": credenciado.estado,
+    for chave, credenciado_id, valor in db.execute(consulta):
 
-        "cep": credenciado.cep,
+        atuais.setdefault((credenciado_id, chave), set()).add(valor)
 
-        "telefone": credenciado.telefone,
+    
 
-        "email": credenciado.email,
+    remover, adicionar, alterados = {}, {}, set()
 
-        "latitude": lat,
+    for credenciado_id, enviadas in associacoes.items():
 
-        "longitude": lng,
+        for chave, valores in enviadas.items():
 
-        "parceiro_estrategico": credenciado.parceiro_estrategico,
+            novos = {int(v) for v in valores}
 
-        "tempo_medio_agendamento": credenciado.tempo_medio_agendamento,
+            existentes = atuais.get((credenciado_id, chave), set())
 
-        "tempo_medio_procedimento": credenciado.tempo_medio_procedimento,
+            removidos = sorted(existentes - novos)
 
-        "data_contrato": credenciado.data_contrato.isoformat() if credenciado.data_contrato else None,
+            adicionados = sorted(novos - existentes)
 
-        "ultima_atualizacao": credenciado.ultima_atualizacao.isoformat() if credenciado.ultima_atualizacao else None,
+            remover.setdefault(chave, []).extend((credenciado_id, v) for v in removidos)
 
-        "especialidades": especialidades,
+            adicionar.setdefault(chave, []).extend((credenciado_id, v) for v in adicionados)
 
-        "diferenciais": diferenciais,
+            if removidos or adicionados:
 
-        "redes": redes,
+                alterados.add(credenciado_id)
 
-        "complexidades": complexidades,
+    _gravar_associacoes(db, remover, adicionar)
 
-    }), 200
+    return alterados
 
 
 
@@ -444,13 +2159,15 @@ def atualizar_credenciado(credenciado_id):
 
     
 
-    especialidades_ids = data.pop('especialidades_ids', None)
+    associacoes = {}
 
-    diferenciais_ids = data.pop('diferenciais_ids', None)
+    for chave, _, _, _ in ASSOCIACOES_EDITAVEIS:
 
-    redes_ids = data.pop('redes_ids', None)
+        valor = data.pop(chave, None)
 
-    complexidades_especialidades_ids = data.pop('complexidades_especialidades_ids', None)
+        if valor is not None:
+
+            associacoes[chave] = valor
 
     
 
@@ -502,179 +2219,147 @@ def atualizar_credenciado(credenciado_id):
 
     
 
-    if especialidades_ids is not None:
-
-        db.query(CredenciadoEspecialidade).filter(
+    campos = [atributo.key for atributo in inspect(db_credenciado).attrs if atributo.history.has_changes()]
 
-            CredenciadoEspecialidade.id_credenciado == credenciado_id
+    if _sincronizar_associacoes(db, {credenciado_id: associacoes}):
 
-        ).delete()
+        db_credenciado.ultima_atualizacao = func.now()
 
-        for esp_id in especialidades_ids:
+        campos.extend(associacoes)
 
-            db.add(CredenciadoEspecialidade(
-
-                id_credenciado=credenciado_id,
-
-                id_especialidade=esp_id
-
-            ))
+    if campos:
 
-    
+        registrar_eventos(db, [('update', credenciado_id, campos)])
 
     
 
-    if diferenciais_ids is not None:
-
-        db.query(CredenciadoDiferencial).filter(
-
-            CredenciadoDiferencial.id_credenciado == credenciado_id
-
-        ).delete()
-
-        for dif_id in diferenciais_ids:
-
-            db.add(CredenciadoDiferencial(
-
-                id_credenciado=credenciado_id,
-
-                id_diferencial=dif_id
-
-            ))
+    db.commit()
 
-    
+    notificar_alteracao(db, [credenciado_id])
 
     
 
-    if redes_ids is not None:
-
-        db.query(CredenciadoRede).filter(
-
-            CredenciadoRede.id_credenciado == credenciado_id
-
-        ).delete()
-
-        for rede_id in redes_ids:
-
-            db.add(CredenciadoRede(
+    return jsonify({
 
-                id_credenciado=credenciado_id,
+        "message": "Credenciado atualizado com sucesso",
 
-                id_rede=rede_id
+        **_detalhar_credenciados(db, [credenciado_id])[0],
 
-            ))
+    }), 200
 
-    
 
-    if complexidades_especialidades_ids is not None:
 
-        db.query(CredenciadoComplexidade).filter(
+def _excluir_credenciados(db, ids):
 
-            CredenciadoComplexidade.id_credenciado == credenciado_id
+    """Exclui credenciados e suas associações com DELETEs por conjunto, em lotes de ids, registrando as exclusões; não faz commit"""
 
-        ).delete()
+    excluidos = 0
 
-        for esp_id in complexidades_especialidades_ids:
+    for inicio in range(0, len(ids), LOTE_EXCLUSAO):
 
-            db.add(CredenciadoComplexidade(
+        lote = ids[inicio:inicio + LOTE_EXCLUSAO]
 
-                id_credenciado=credenciado_id,
+        db.execute(insert(CredenciadoExcluido).from_select(
 
-                id_especialidade=esp_id,
+            ['id_credenciado'], select(Credenciado.id).where(Credenciado.id.in_(lote))
 
-                id_credenciamento=None
+        ))
 
-            ))
+        db.execute(insert(EventoCredenciado).from_select(
 
-    
+            ['id_credenciado', 'operacao'], select(Credenciado.id, literal('delete')).where(Credenciado.id.in_(lote))
 
-    db.commit()
+        ))
 
-    db.refresh(db_credenciado)
+        for _, modelo, _, _ in ASSOCIACOES_EDITAVEIS:
 
+            db.execute(
 
+                delete(modelo).where(modelo.id_credenciado.in_(lote)).execution_options(synchronize_session=False)
 
-    
+            )
 
-    especialidades = [
+        resultado = db.execute(
 
-        {"id": e.id, "descricao": e.descricao}
+            delete(Credenciado).where(Credenciado.id.in_(lote)).execution_options(synchronize_session=False)
 
-        for e in getattr(db_credenciado, 'especialidades', [])
+        )
 
-    ]
+        excluidos += resultado.rowcount
 
-    diferenciais = [
+    return excluidos
 
-        {"id": d.id, "descricao": d.descricao}
 
-        for d in getattr(db_credenciado, 'diferenciais', [])
 
-    ]
+@credenciados_bp.route('/bulk', methods=['DELETE'])
 
-    redes = [
+def excluir_credenciados_lote():
 
-        {"id": r.id, "nome": r.nome}
+    """Exclui credenciados por ids (?ids=1,2,3) e/ou pelos filtros da listagem, em uma transação; ?dry_run=1 só conta"""
 
-        for r in getattr(db_credenciado, 'redes', [])
+    cargo = (session.get('cargo') or '').lower()
 
-    ]
+    if cargo not in {"admin", "credenciamento", "ti", "ceo"}:
 
+        return jsonify({"error": "Sem permissão para excluir"}), 403
 
+    try:
 
-    complexidades = [
+        ids = _ids_parametro(request.args, 'ids')
 
-        {
+        criterios = _criterios_listagem(request.args)
 
-            "id": cc.id,
+    except ValueError as e:
 
-            "id_especialidade": cc.id_especialidade,
+        return jsonify({"error": str(e)}), 400
 
-            "especialidade": getattr(cc.especialidade, 'descricao', None)
+    if ids:
 
-        }
+        criterios.append(Credenciado.id.in_(ids))
 
-        for cc in getattr(db_credenciado, 'complexidades', [])
+    if not criterios:
 
-    ]
+        return jsonify({"error": "Informe ids ou ao menos um filtro"}), 400
 
+    dry_run = (request.args.get('dry_run') or '').lower() in ('1', 'true', 'sim')
 
+    
 
-    return jsonify({
+    db = get_db()
 
-        "message": "Credenciado atualizado com sucesso",
+    if dry_run:
 
-        "id": db_credenciado.id,
+        total = db.scalar(select(func.count()).select_from(Credenciado).where(*criterios))
 
-        "nome": db_credenciado.nome,
+        return jsonify({"dry_run": True, "total": total}), 200
 
-        "telefone": db_credenciado.telefone,
+    
 
-        "email": db_credenciado.email,
+    alvo = list(db.scalars(select(Credenciado.id).where(*criterios).order_by(Credenciado.id)))
 
-        "status": db_credenciado.status,
+    if not alvo:
 
-        "tipo": db_credenciado.tipo,
+        return jsonify({"deleted": 0}), 200
 
-        "cidade": db_credenciado.cidade,
+    try:
 
-        "estado": db_credenciado.estado,
+        excluidos = _excluir_credenciados(db, alvo)
 
-        "complexidade": db_credenciado.complexidade,
+        db.commit()
 
-        "especialidades": especialidades,
+    except Exception as e:
 
-        "diferenciais": diferenciais,
+        db.rollback()
 
-        "redes": redes,
+        print(f"[v0] ✗ ERRO na exclusão em lote: {str(e)}")
 
-        "complexidades": complexidades,
+        return jsonify({"error": f"Erro ao excluir o lote: {str(e)}"}), 500
 
-        "data_contrato": db_credenciado.data_contrato.isoformat() if db_credenciado.data_contrato else None,
+    notificar_alteracao(db, alvo)
 
-        "ultima_atualizacao": db_credenciado.ultima_atualizacao.isoformat() if db_credenciado.ultima_atualizacao else None,
+    
 
-    }), 200
+    return jsonify({"deleted": excluidos}), 200
 
 
 
@@ -694,20 +2379,14 @@ def deletar_credenciado(credenciado_id):
 
     db = get_db()
 
-    db_credenciado = db.query(Credenciado).filter(Credenciado.id == credenciado_id).first()
-
-    
-
-    if not db_credenciado:
+    if not _excluir_credenciados(db, [credenciado_id]):
 
         return jsonify({"error": "Credenciado não encontrado"}), 404
 
-    
-
-    db.delete(db_credenciado)
-
     db.commit()
 
+    notificar_alteracao(db, [credenciado_id])
+
     
 
     return '', 204
@@ -718,21 +2397,39 @@ def deletar_credenciado(credenciado_id):
 
 def contar_credenciados():
 
-    """Conta o total de credenciados no banco"""
+    """Conta os credenciados no banco, com os mesmos filtros opcionais da listagem"""
+
+    try:
+
+        criterios = _criterios_listagem(request.args)
+
+    except ValueError as e:
+
+        return jsonify({"error": str(e)}), 400
+
+    
 
     db = get_db()
 
-    total = db.query(Credenciado).count()
+    q = (request.args.get('q') or '').strip()
+
+    if q:
+
+        criterio, _ = criterio_busca(db, q)
+
+        criterios.append(criterio)
+
+    total = _totais(db, request.args, criterios)[0]
 
     
 
-    return jsonify({
+    return _com_total(jsonify({
 
         "total_credenciados": total,
 
         "message": f"Existem {total} credenciados no banco de dados"
 
-    }), 200
+    }), total), 200
 
 
 
@@ -792,10 +2489,14 @@ def test_insert():
 
         
 
+        registrar_eventos(db, [('insert', credenciado_teste.id, None)])
+
         db.commit()
 
         print("[v0] ✓ Commit executado com sucesso!")
 
+        notificar_alteracao(db, [credenciado_teste.id])
+
         
 
         
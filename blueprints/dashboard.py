@@ -1,6 +1,6 @@
 from flask import Blueprint, jsonify
 
-from sqlalchemy import func, and_, or_, case
+from sqlalchemy import func, and_, case
 
 from database import get_db
 
@@ -56,13 +56,9 @@ def get_dashboard():
 
 
 
-    active = db.query(func.count(Credenciado.id)).filter(func.lower(Credenciado.status) == 'ativo').scalar() or 0
+    active = db.query(func.count(Credenciado.id)).filter(Credenciado.status_busca == 'ativo').scalar() or 0
 
-    under_review = db.query(func.count(Credenciado.id)).filter(
-
-        or_(func.lower(Credenciado.status) == 'em análise', func.lower(Credenciado.status) == 'em analise')
-
-    ).scalar() or 0
+    under_review = db.query(func.count(Credenciado.id)).filter(Credenciado.status_busca == 'em analise').scalar() or 0
 
     strategic = db.query(func.count(Credenciado.id)).filter(Credenciado.parceiro_estrategico == True).scalar() or 0
 
@@ -142,7 +138,15 @@ def get_dashboard():
 
     
 
-    dist_rows = db.query(Credenciado.status, func.count(Credenciado.id)).group_by(Credenciado.status).all()
+    dist_rows = (
+
+        db.query(func.min(Credenciado.status), func.count(Credenciado.id))
+
+        .group_by(Credenciado.status_busca)
+
+        .all()
+
+    )
 
     status_distribution = []
 
@@ -2,7 +2,13 @@ from flask import Blueprint, request, jsonify, session
 
 from database import get_db
 
-from models import Diferencial
+from sqlalchemy import select
+
+from caches import notificar_alteracao
+
+from models import CredenciadoDiferencial, Diferencial
+
+from sincronizacao import marcar_alterados
 
 
 
@@ -10,6 +16,18 @@ diferenciais_bp = Blueprint('diferenciais', __name__)
 
 
 
+def _marcar_credenciados(db, diferencial_id):
+
+    """Credenciados que exibem o diferencial passam a ter nova versão"""
+
+    marcar_alterados(
+
+        db, select(CredenciadoDiferencial.id_credenciado).where(CredenciadoDiferencial.id_diferencial == diferencial_id)
+
+    )
+
+
+
 @diferenciais_bp.route('/', methods=['GET'])
 
 def listar_diferenciais():
@@ -136,10 +154,14 @@ def atualizar_diferencial(diferencial_id):
 
         db_diferencial.nome = data['nome']
 
+        _marcar_credenciados(db, diferencial_id)
+
     
 
     db.commit()
 
+    notificar_alteracao(db)
+
     
 
     return jsonify({
@@ -176,10 +198,14 @@ def deletar_diferencial(diferencial_id):
 
     
 
+    _marcar_credenciados(db, diferencial_id)
+
     db.delete(db_diferencial)
 
     db.commit()
 
+    notificar_alteracao(db)
+
     
 
     return '', 204
@@ -2,7 +2,13 @@ from flask import Blueprint, request, jsonify, session
 
 from database import get_db
 
-from models import Especialidade
+from sqlalchemy import select
+
+from caches import notificar_alteracao
+
+from models import CredenciadoComplexidade, CredenciadoEspecialidade, Especialidade
+
+from sincronizacao import marcar_alterados
 
 
 
@@ -10,6 +16,22 @@ especialidades_bp = Blueprint('especialidades', __name__)
 
 
 
+def _marcar_credenciados(db, especialidade_id):
+
+    """Credenciados que exibem a especialidade (inclusive em complexidades) passam a ter nova versão"""
+
+    marcar_alterados(
+
+        db,
+
+        select(CredenciadoEspecialidade.id_credenciado).where(CredenciadoEspecialidade.id_especialidade == especialidade_id),
+
+        select(CredenciadoComplexidade.id_credenciado).where(CredenciadoComplexidade.id_especialidade == especialidade_id),
+
+    )
+
+
+
 @especialidades_bp.route('/', methods=['GET'])
 
 def listar_especialidades():
@@ -136,10 +158,14 @@ def atualizar_especialidade(especialidade_id):
 
         db_especialidade.descricao = data['descricao']
 
+        _marcar_credenciados(db, especialidade_id)
+
     
 
     db.commit()
 
+    notificar_alteracao(db)
+
     
 
     return jsonify({
@@ -176,10 +202,14 @@ def deletar_especialidade(especialidade_id):
 
     
 
+    _marcar_credenciados(db, especialidade_id)
+
     db.delete(db_especialidade)
 
     db.commit()
 
+    notificar_alteracao(db)
+
     
 
     return '', 204
@@ -6,15 +6,15 @@ from datetime import datetime
 
 from werkzeug.utils import secure_filename
 
-import os
+import json
 
-import pandas as pd
+import os
 
-from database import get_db, engine
+from database import get_db
 
-from models import Importacao, Credenciado, Especialidade, Diferencial, Rede
+from importador import agendar_importacao
 
-from sqlalchemy import text
+from models import Importacao
 
 
 
@@ -56,7 +56,9 @@ def listar_importacoes():
 
         "id": i.id,
 
-        "descricao": i.descricao
+        "descricao": i.descricao,
+
+        "status": i.status
 
     } for i in importacoes]), 200
 
@@ -66,7 +68,7 @@ def listar_importacoes():
 
 def obter_importacao(importacao_id):
 
-    """Obtém uma importação específica"""
+    """Obtém uma importação específica, com o andamento enquanto ela roda"""
 
     db = get_db()
 
@@ -80,11 +82,51 @@ def obter_importacao(importacao_id):
 
     
 
+    processadas = importacao.linhas_processadas or 0
+
+    if importacao.total_linhas:
+
+        progresso = round(100 * processadas / importacao.total_linhas, 1)
+
+    else:
+
+        progresso = 100.0 if importacao.status == 'concluida' else 0.0
+
+    
+
     return jsonify({
 
         "id": importacao.id,
 
-        "descricao": importacao.descricao
+        "descricao": importacao.descricao,
+
+        "status": importacao.status,
+
+        "arquivo": importacao.arquivo,
+
+        "total_registros": importacao.total_linhas,
+
+        "linhas_processadas": processadas,
+
+        "progresso": progresso,
+
+        "registros_importados": importacao.registros_importados or 0,
+
+        "registros_atualizados": importacao.registros_atualizados or 0,
+
+        "duplicados_ignorados_no_arquivo": importacao.duplicados_ignorados or 0,
+
+        "total_erros": importacao.total_erros or 0,
+
+        "erros": json.loads(importacao.erros) if importacao.erros else [],
+
+        "mensagem": importacao.mensagem,
+
+        "criado_em": importacao.criado_em.isoformat() if importacao.criado_em else None,
+
+        "iniciado_em": importacao.iniciado_em.isoformat() if importacao.iniciado_em else None,
+
+        "concluido_em": importacao.concluido_em.isoformat() if importacao.concluido_em else None,
 
     }), 200
 
@@ -138,7 +180,7 @@ def criar_importacao():
 
 def upload_arquivo():
 
-    """Faz upload e processa arquivo de importação"""
+    """Recebe o arquivo de importação e agenda o processamento; o andamento sai em GET /<id>"""
 
     cargo = (session.get('cargo') or '').lower()
 
@@ -198,117 +240,15 @@ def upload_arquivo():
 
         
 
-        
-
-        if filename.endswith('.csv'):
-
-            try:
-
-                df = pd.read_csv(filepath, encoding='utf-8')
-
-            except UnicodeDecodeError:
-
-                df = pd.read_csv(filepath, encoding='latin-1')
-
-        else:
-
-            df = pd.read_excel(filepath)
-
-        
-
-        print(f"[v0] ✓ Arquivo lido com sucesso. Total de linhas: {len(df)}")
-
-        print(f"[v0] Colunas originais: {df.columns.tolist()}")
-
-        
-
-        df.columns = df.columns.str.strip().str.lower()
-
-        print(f"[v0] Colunas normalizadas: {df.columns.tolist()}")
-
-        
-
-        
-
-        colunas_obrigatorias = ['nome']
-
-        colunas_faltando = [col for col in colunas_obrigatorias if col not in df.columns]
-
-        
-
-        if colunas_faltando:
-
-            return jsonify({
-
-                "error": f"Colunas obrigatórias faltando: {', '.join(colunas_faltando)}",
-
-                "colunas_encontradas": df.columns.tolist(),
-
-                "colunas_esperadas": ['nome', 'crm', 'telefone', 'email', 'status', 'tipo', 'logradouro', 'bairro', 'numero', 'cidade', 'estado', 'cep', 'complexidade']
-
-            }), 400
-
-        
-
         db = get_db()
 
-        print("[v0] ✓ Conexão com banco obtida")
-
-
-
-        
-
-        try:
-
-            with engine.connect() as conn:
-
-                exists = conn.execute(
-
-                    text(
-
-                        """
-                        SELECT COUNT(*)
-                        FROM INFORMATION_SCHEMA.COLUMNS
-                        WHERE TABLE_SCHEMA = DATABASE()
-                          AND TABLE_NAME = 'credenciado'
-                          AND COLUMN_NAME = 'credenciamento'
-                        """
-
-                    )
-
-                ).scalar()
-
-                if not exists:
-
-                    print("[v0] Coluna 'credenciamento' não existe. Criando coluna...")
-
-                    conn.execute(text("ALTER TABLE credenciado ADD COLUMN credenciamento VARCHAR(50) NULL"))
-
-                    
-
-                    try:
-
-                        conn.execute(text("CREATE INDEX idx_credenciado_credenciamento ON credenciado(credenciamento)"))
-
-                    except Exception:
-
-                        pass
-
-                    print("[v0] ✓ Coluna 'credenciamento' criada")
-
-        except Exception as e:
-
-            
-
-            print(f"[v0] Aviso: não foi possível garantir coluna 'credenciamento': {e}")
-
-        
+        db_importacao = Importacao(
 
-        
+            descricao=f"Importação de arquivo: {file.filename}"[:150],
 
-        db_importacao = Importacao(
+            status='pendente',
 
-            descricao=f"Importação de arquivo: {file.filename} ({len(df)} registros)"
+            arquivo=filename,
 
         )
 
@@ -316,347 +256,25 @@ def upload_arquivo():
 
         db.commit()
 
-        db.refresh(db_importacao)
-
-        
-
-        print(f"[v0] ✓ Importação registrada com ID: {db_importacao.id}")
-
-        
-
-        registros_importados = 0
-
-        registros_atualizados = 0
-
-        registros_ignorados_duplicados = 0
-
-        erros = []
-
-        vistos_no_arquivo = set()
-
-
-
-        def normaliza_codigo(valor):
-
-            if pd.isna(valor):
-
-                return None
-
-            s = str(valor).strip()
-
-            if s == "":
-
-                return None
-
-            
-
-            
-
-            try:
-
-                
-
-                if s.isdigit():
-
-                    return s
-
-                f = float(s)
-
-                i = int(f)
-
-                if f == float(i):
-
-                    return str(i)
-
-            except Exception:
-
-                pass
-
-            return s
-
-        
-
-        for index, row in df.iterrows():
-
-            try:
-
-                print(f"[v0] Processando linha {index + 1}/{len(df)}")
-
-                
-
-                nome = str(row.get('nome', '')).strip() if pd.notna(row.get('nome')) else None
-
-                if not nome:
-
-                    erros.append(f"Linha {index + 2}: Nome é obrigatório")
-
-                    continue
-
-                
-
-                codigo = None
-
-                for alias in ['credenciamento', 'codigo', 'cod', 'id_credenciamento', 'id']:
-
-                    if alias in df.columns:
-
-                        codigo = normaliza_codigo(row.get(alias))
-
-                        if codigo:
-
-                            break
-
-                if codigo and codigo in vistos_no_arquivo:
-
-                    registros_ignorados_duplicados += 1
-
-                    print(f"[v0] • Duplicado no arquivo detectado para código {codigo}; ignorando esta linha")
-
-                    continue
-
-                
-
-                
-
-                payload = dict(
-
-                    nome=nome,
-
-                    crm=str(row.get('crm', '')).strip() if pd.notna(row.get('crm')) else None,
-
-                    telefone=str(row.get('telefone', '')).strip() if pd.notna(row.get('telefone')) else None,
-
-                    email=str(row.get('email', '')).strip() if pd.notna(row.get('email')) else None,
-
-                    status=str(row.get('status', '')).strip() if pd.notna(row.get('status')) else None,
-
-                    tipo=str(row.get('tipo', '')).strip() if pd.notna(row.get('tipo')) else None,
-
-                    logradouro=str(row.get('logradouro', '')).strip() if pd.notna(row.get('logradouro')) else None,
-
-                    bairro=str(row.get('bairro', '')).strip() if pd.notna(row.get('bairro')) else None,
-
-                    numero=str(row.get('numero', '')).strip() if pd.notna(row.get('numero')) else None,
-
-                    cidade=str(row.get('cidade', '')).strip() if pd.notna(row.get('cidade')) else None,
-
-                    estado=str(row.get('estado', '')).strip() if pd.notna(row.get('estado')) else None,
-
-                    cep=str(row.get('cep', '')).strip() if pd.notna(row.get('cep')) else None,
-
-                    complexidade=str(row.get('complexidade', '')).strip() if pd.notna(row.get('complexidade')) else None,
-
-                )
-
-
-
-                
-
-                if codigo:
-
-                    vistos_no_arquivo.add(codigo)
-
-                    existente = None
-
-                    try:
-
-                        existente = db.query(Credenciado).filter(Credenciado.credenciamento == codigo).first()
-
-                    except Exception as qerr:
-
-                        
-
-                        print(f"[v0] Aviso na consulta por 'credenciamento': {qerr}")
-
-
-
-                    
-
-                    if not existente:
-
-                        crm = payload.get('crm')
-
-                        email = payload.get('email')
-
-                        telefone = payload.get('telefone')
-
-                        cidade = payload.get('cidade')
-
-                        
-
-                        if crm:
-
-                            cand = db.query(Credenciado).filter(Credenciado.crm == crm).all()
-
-                            if len(cand) == 1:
-
-                                existente = cand[0]
-
-                        
-
-                        if not existente and email:
-
-                            cand = db.query(Credenciado).filter(Credenciado.email == email).all()
-
-                            if len(cand) == 1:
-
-                                existente = cand[0]
-
-                        
-
-                        if not existente and telefone:
-
-                            cand = db.query(Credenciado).filter(Credenciado.telefone == telefone).all()
-
-                            if len(cand) == 1:
-
-                                existente = cand[0]
-
-                        
-
-                        if not existente and nome:
-
-                            q = db.query(Credenciado).filter(Credenciado.nome == nome)
-
-                            if cidade:
-
-                                q = q.filter(Credenciado.cidade == cidade)
-
-                            cand = q.all()
-
-                            if len(cand) == 1:
-
-                                existente = cand[0]
-
-
-
-                    if existente:
-
-                        
-
-                        for k, v in payload.items():
-
-                            setattr(existente, k, v)
-
-                        existente.credenciamento = codigo
-
-                        print(f"[v0] ↻ Atualizado credenciado existente (ID {existente.id}) para código {codigo}")
-
-                        registros_atualizados += 1
-
-                    else:
-
-                        credenciado = Credenciado(credenciamento=codigo, **payload)
-
-                        db.add(credenciado)
-
-                        db.flush()
-
-                        print(f"[v0] ✓ Inserido novo credenciado (código {codigo}) com ID {credenciado.id}")
-
-                        registros_importados += 1
-
-                else:
-
-                    
-
-                    existente = None
-
-                    crm = payload.get('crm')
-
-                    email = payload.get('email')
-
-                    if crm:
-
-                        cand = db.query(Credenciado).filter(Credenciado.crm == crm).all()
-
-                        if len(cand) == 1:
-
-                            existente = cand[0]
-
-                    if not existente and email:
-
-                        cand = db.query(Credenciado).filter(Credenciado.email == email).all()
-
-                        if len(cand) == 1:
-
-                            existente = cand[0]
-
-                    if existente:
-
-                        for k, v in payload.items():
-
-                            setattr(existente, k, v)
-
-                        print(f"[v0] ↻ Atualizado credenciado existente (sem código) ID {existente.id}")
-
-                        registros_atualizados += 1
-
-                    else:
-
-                        credenciado = Credenciado(**payload)
-
-                        db.add(credenciado)
-
-                        db.flush()
-
-                        print(f"[v0] ✓ Inserido novo credenciado (sem código) com ID {credenciado.id}")
-
-                        registros_importados += 1
-
-                
-
-            except Exception as e:
-
-                erro_msg = f"Linha {index + 2}: {str(e)}"
-
-                print(f"[v0] ✗ ERRO: {erro_msg}")
-
-                erros.append(erro_msg)
-
-                continue
-
-        
-
-        print(f"[v0] Executando commit final de {registros_importados} novos e {registros_atualizados} atualizados...")
-
-        db.commit()
-
-        print(f"[v0] ✓ Commit realizado com sucesso!")
-
-        
+        importacao_id = db_importacao.id
 
         
 
-        total_no_banco = db.query(Credenciado).count()
-
-        print(f"[v0] ========== RESULTADO ==========")
+        agendar_importacao(importacao_id, filepath, file.filename)
 
-        print(f"[v0] Total de credenciados no banco após importação: {total_no_banco}")
-
-        print(f"[v0] Registros importados nesta operação: {registros_importados}")
+        print(f"[v0] ✓ Importação {importacao_id} agendada")
 
         
 
         return jsonify({
 
-            "message": "Arquivo importado com sucesso",
-
-            "importacao_id": db_importacao.id,
-
-            "total_registros": len(df),
-
-            "registros_importados": registros_importados,
-
-            "registros_atualizados": registros_atualizados,
-
-            "duplicados_ignorados_no_arquivo": registros_ignorados_duplicados,
+            "message": "Arquivo recebido; importação em andamento",
 
-            "total_no_banco": total_no_banco,
+            "importacao_id": importacao_id,
 
-            "erros": erros[:10] if erros else []
+            "status": "pendente",
 
-        }), 201
+        }), 202
 
         
 
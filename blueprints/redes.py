@@ -2,7 +2,13 @@ from flask import Blueprint, request, jsonify, session
 
 from database import get_db
 
-from models import Rede
+from sqlalchemy import select
+
+from caches import notificar_alteracao
+
+from models import CredenciadoRede, Rede
+
+from sincronizacao import marcar_alterados
 
 
 
@@ -10,6 +16,14 @@ redes_bp = Blueprint('redes', __name__)
 
 
 
+def _marcar_credenciados(db, rede_id):
+
+    """Credenciados que exibem a rede passam a ter nova versão"""
+
+    marcar_alterados(db, select(CredenciadoRede.id_credenciado).where(CredenciadoRede.id_rede == rede_id))
+
+
+
 @redes_bp.route('/', methods=['GET'])
 
 def listar_redes():
@@ -144,10 +158,14 @@ def atualizar_rede(rede_id):
 
         db_rede.nome = data['nome']
 
+        _marcar_credenciados(db, rede_id)
+
     
 
     db.commit()
 
+    notificar_alteracao(db)
+
     
 
     return jsonify({
@@ -184,10 +202,14 @@ def deletar_rede(rede_id):
 
     
 
+    _marcar_credenciados(db, rede_id)
+
     db.delete(db_rede)
 
     db.commit()
 
+    notificar_alteracao(db)
+
     
 
     return '', 204
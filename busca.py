@@ -0,0 +1,341 @@
+"""
+Busca textual de credenciados por nome, cidade e bairro.
+No MySQL usa o índice FULLTEXT ft_credenciado_busca com ranking por relevância;
+nos demais bancos (SQLite dos testes) usa um índice de trigramas em memória.
+"""
+
+
+
+import re
+
+import threading
+
+from collections import defaultdict
+
+from sqlalchemy import bindparam, case, select, update
+
+from sqlalchemy.dialects.mysql import match
+
+from caches import ao_alterar_credenciados
+
+from models import Credenciado, CAMPOS_BUSCA, campos_busca, normalizar_texto
+
+
+
+LIMIAR_SIMILARIDADE = 0.6
+
+MAX_CANDIDATOS = 1000
+
+LOTE_PREENCHIMENTO = 5000
+
+_CARACTERES_BOOLEANOS = re.compile(r'[+\-<>()~*"@]')
+
+TAMANHO_MINIMO_TOKEN = 3
+
+PALAVRAS_VAZIAS_INNODB = frozenset((
+
+    'a', 'about', 'an', 'are', 'as', 'at', 'be', 'by', 'com', 'de', 'en', 'for', 'from', 'how', 'i',
+
+    'in', 'is', 'it', 'la', 'of', 'on', 'or', 'that', 'the', 'this', 'to', 'was', 'what', 'when',
+
+    'where', 'who', 'will', 'with', 'und', 'www',
+
+))
+
+
+
+def _trigramas(texto, prefixo=False):
+
+    """Trigramas das palavras do texto; com prefixo=True a última palavra não é fechada"""
+
+    palavras = re.findall(r'\w+', normalizar_texto(texto) or '')
+
+    trigramas = set()
+
+    for n, palavra in enumerate(palavras):
+
+        fim = '' if prefixo and n == len(palavras) - 1 else ' '
+
+        preenchida = f"  {palavra}{fim}"
+
+        for i in range(len(preenchida) - 2):
+
+            trigramas.add(preenchida[i:i + 3])
+
+    return trigramas
+
+
+
+class IndiceTrigramas:
+
+    """Índice invertido trigrama -> ids, atualizado por id após escritas"""
+
+
+
+    def __init__(self):
+
+        self._lock = threading.Lock()
+
+        self._postings = defaultdict(set)
+
+        self._por_id = {}
+
+        self.construido = False
+
+
+
+    def construir(self, db):
+
+        with self._lock:
+
+            self._postings = defaultdict(set)
+
+            self._por_id = {}
+
+            rows = db.execute(select(Credenciado.id, Credenciado.nome, Credenciado.cidade, Credenciado.bairro))
+
+            for row in rows:
+
+                self._indexar(row.id, row.nome, row.cidade, row.bairro)
+
+            self.construido = True
+
+
+
+    def _indexar(self, credenciado_id, *textos):
+
+        trigramas = _trigramas(' '.join(t for t in textos if t))
+
+        self._por_id[credenciado_id] = trigramas
+
+        for t in trigramas:
+
+            self._postings[t].add(credenciado_id)
+
+
+
+    def _remover(self, credenciado_id):
+
+        for t in self._por_id.pop(credenciado_id, ()):
+
+            ids = self._postings.get(t)
+
+            if ids is not None:
+
+                ids.discard(credenciado_id)
+
+                if not ids:
+
+                    del self._postings[t]
+
+
+
+    def atualizar(self, db, ids):
+
+        rows = db.execute(
+
+            select(Credenciado.id, Credenciado.nome, Credenciado.cidade, Credenciado.bairro)
+
+            .where(Credenciado.id.in_(ids))
+
+        ).all()
+
+        with self._lock:
+
+            for credenciado_id in ids:
+
+                self._remover(credenciado_id)
+
+            for row in rows:
+
+                self._indexar(row.id, row.nome, row.cidade, row.bairro)
+
+
+
+    def invalidar(self):
+
+        with self._lock:
+
+            self.construido = False
+
+            self._postings = defaultdict(set)
+
+            self._por_id = {}
+
+
+
+    def buscar(self, termo, limite=MAX_CANDIDATOS):
+
+        """Retorna ids ordenados pela fração de trigramas do termo presentes no credenciado"""
+
+        consulta = _trigramas(termo, prefixo=True)
+
+        if not consulta:
+
+            return []
+
+        acertos = defaultdict(int)
+
+        with self._lock:
+
+            for t in consulta:
+
+                for credenciado_id in self._postings.get(t, ()):
+
+                    acertos[credenciado_id] += 1
+
+        minimo = LIMIAR_SIMILARIDADE * len(consulta)
+
+        ranking = sorted(
+
+            (credenciado_id for credenciado_id, n in acertos.items() if n >= minimo),
+
+            key=lambda credenciado_id: (-acertos[credenciado_id], credenciado_id),
+
+        )
+
+        return ranking[:limite]
+
+
+
+indice_trigramas = IndiceTrigramas()
+
+
+
+@ao_alterar_credenciados
+
+def _atualizar_indice_trigramas(db, ids):
+
+    if not indice_trigramas.construido:
+
+        return
+
+    if ids is None:
+
+        indice_trigramas.invalidar()
+
+    else:
+
+        indice_trigramas.atualizar(db, ids)
+
+
+
+def _termo_booleano(termo):
+
+    """Palavras obrigatórias em modo booleano, sem as que o FULLTEXT do InnoDB não indexa (curtas ou stopwords)"""
+
+    palavras = [
+
+        p for p in _CARACTERES_BOOLEANOS.sub(' ', termo).split()
+
+        if len(p) >= TAMANHO_MINIMO_TOKEN and p.lower() not in PALAVRAS_VAZIAS_INNODB
+
+    ]
+
+    return ' '.join(f"+{p}*" for p in palavras)
+
+
+
+def criterio_busca(db, termo):
+
+    """Retorna (criterio, ordenacao) para filtrar e ranquear a listagem pelo termo buscado; no MySQL, termo
+    só com palavras que o FULLTEXT ignora (ex.: "SP", "de") vira busca por prefixo do nome"""
+
+    if db.get_bind().dialect.name == 'mysql':
+
+        booleano = _termo_booleano(termo)
+
+        if not booleano:
+
+            return Credenciado.nome_busca.like(f"{normalizar_texto(termo)}%"), [Credenciado.nome_busca, Credenciado.id]
+
+        relevancia = match(
+
+            Credenciado.nome, Credenciado.cidade, Credenciado.bairro,
+
+            against=booleano,
+
+        ).in_boolean_mode()
+
+        return relevancia, [relevancia.desc(), Credenciado.id]
+
+    
+
+    if not indice_trigramas.construido:
+
+        indice_trigramas.construir(db)
+
+    ids = indice_trigramas.buscar(termo)
+
+    if not ids:
+
+        return Credenciado.id.in_([]), [Credenciado.id]
+
+    posicao = case({credenciado_id: n for n, credenciado_id in enumerate(ids)}, value=Credenciado.id)
+
+    return Credenciado.id.in_(ids), [posicao, Credenciado.id]
+
+
+
+def preencher_campos_busca(engine):
+
+    """Preenche as colunas *_busca de registros anteriores a elas, em lotes"""
+
+    tabela = Credenciado.__table__
+
+    colunas = [tabela.c[campo] for campo in CAMPOS_BUSCA]
+
+    atualizar = (
+
+        update(tabela)
+
+        .where(tabela.c.id == bindparam('b_id'))
+
+        .values(
+
+            ultima_atualizacao=tabela.c.ultima_atualizacao,
+
+            **{sombra: bindparam(f"b_{sombra}") for sombra in CAMPOS_BUSCA.values()}
+
+        )
+
+    )
+
+    total = 0
+
+    while True:
+
+        with engine.begin() as conn:
+
+            rows = conn.execute(
+
+                select(tabela.c.id, *colunas)
+
+                .where(tabela.c.nome_busca.is_(None))
+
+                .limit(LOTE_PREENCHIMENTO)
+
+            ).all()
+
+            if not rows:
+
+                break
+
+            lote = []
+
+            for row in rows:
+
+                valores = campos_busca({campo: getattr(row, campo) for campo in CAMPOS_BUSCA})
+
+                valores['nome_busca'] = valores['nome_busca'] or ''
+
+                lote.append({"b_id": row.id, **{f"b_{k}": v for k, v in valores.items()}})
+
+            conn.execute(atualizar, lote)
+
+            total += len(rows)
+
+    if total:
+
+        print(f"[v0] ✓ Colunas de busca preenchidas em {total} credenciados")
+
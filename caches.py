@@ -0,0 +1,127 @@
+"""
+Registro dos caches em memória derivados da tabela de credenciados.
+Os fluxos de escrita chamam notificar_alteracao após o commit.
+"""
+
+
+
+import os
+
+import threading
+
+import time
+
+
+
+TTL_CONTAGENS = float(os.getenv('CACHE_CONTAGENS_TTL', '30'))
+
+MAX_CHAVES_CONTAGENS = 1024
+
+
+
+_ouvintes = []
+
+
+
+def ao_alterar_credenciados(funcao):
+
+    """Registra funcao(db, ids) para ser chamada após escritas em credenciados"""
+
+    _ouvintes.append(funcao)
+
+    return funcao
+
+
+
+def notificar_alteracao(db, ids=None):
+
+    """Avisa os caches registrados; ids=None indica que qualquer credenciado pode ter mudado"""
+
+    for funcao in _ouvintes:
+
+        try:
+
+            funcao(db, ids)
+
+        except Exception as e:
+
+            print(f"[v0] Aviso: falha ao atualizar cache {funcao.__name__}: {e}")
+
+
+
+class CacheTTL:
+
+    """Valores por chave que expiram após ttl segundos; limpar() descarta tudo"""
+
+    
+
+    def __init__(self, ttl, maximo):
+
+        self.ttl = ttl
+
+        self.maximo = maximo
+
+        self._lock = threading.Lock()
+
+        self._itens = {}
+
+        self._geracao = 0
+
+    
+
+    def obter(self, chave, calcular):
+
+        """Valor em cache para a chave ou, se ausente/expirado, calcular() (guardado se nada mudou no meio)"""
+
+        agora = time.monotonic()
+
+        with self._lock:
+
+            item = self._itens.get(chave)
+
+            if item is not None and item[0] > agora:
+
+                return item[1]
+
+            geracao = self._geracao
+
+        
+
+        valor = calcular()
+
+        with self._lock:
+
+            if geracao == self._geracao and self.ttl > 0:
+
+                if len(self._itens) >= self.maximo:
+
+                    self._itens = {k: v for k, v in self._itens.items() if v[0] > agora}
+
+                if len(self._itens) < self.maximo:
+
+                    self._itens[chave] = (agora + self.ttl, valor)
+
+        return valor
+
+    
+
+    def limpar(self):
+
+        with self._lock:
+
+            self._itens = {}
+
+            self._geracao += 1
+
+
+
+cache_contagens = CacheTTL(TTL_CONTAGENS, MAX_CHAVES_CONTAGENS)
+
+
+
+@ao_alterar_credenciados
+
+def _limpar_contagens(db, ids):
+
+    cache_contagens.limpar()
+
@@ -1,6 +1,8 @@
 import os
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
+
+from sqlalchemy.schema import CreateColumn
 
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -60,6 +62,86 @@ def init_db():
 
     Base.metadata.create_all(bind=engine)
 
+    garantir_colunas()
+
+    garantir_indices()
+
+
+
+def garantir_colunas():
+
+    """Adiciona em tabelas já existentes as colunas declaradas nos modelos que ainda faltam"""
+
+    insp = inspect(engine)
+
+    for table in Base.metadata.sorted_tables:
+
+        if not insp.has_table(table.name):
+
+            continue
+
+        existentes = {c['name'] for c in insp.get_columns(table.name)}
+
+        for coluna in table.columns:
+
+            if coluna.name in existentes:
+
+                continue
+
+            definicao = CreateColumn(coluna).compile(dialect=engine.dialect)
+
+            try:
+
+                with engine.begin() as conn:
+
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {definicao}"))
+
+                print(f"[v0] ✓ Coluna {table.name}.{coluna.name} criada")
+
+            except Exception as e:
+
+                print(f"[v0] Aviso: não foi possível criar coluna {table.name}.{coluna.name}: {e}")
+
+
+
+def garantir_indices():
+
+    """Cria em tabelas já existentes os índices declarados nos modelos que ainda faltam"""
+
+    insp = inspect(engine)
+
+    for table in Base.metadata.sorted_tables:
+
+        if not insp.has_table(table.name):
+
+            continue
+
+        existentes = {tuple(ix['column_names']) for ix in insp.get_indexes(table.name)}
+
+        for index in table.indexes:
+
+            colunas = tuple(c.name for c in index.columns)
+
+            if colunas in existentes:
+
+                continue
+
+            regra = getattr(index, '_ddl_if', None)
+
+            if regra is not None and regra.dialect not in (None, engine.dialect.name):
+
+                continue
+
+            try:
+
+                index.create(bind=engine)
+
+                print(f"[v0] ✓ Índice {index.name} criado")
+
+            except Exception as e:
+
+                print(f"[v0] Aviso: não foi possível criar índice {index.name}: {e}")
+
 
 
 def get_db():
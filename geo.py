@@ -0,0 +1,290 @@
+"""
+Funções geográficas sobre latitude/longitude dos credenciados.
+"""
+
+
+
+import math
+
+import threading
+
+import numpy as np
+
+from sqlalchemy import select
+
+from caches import ao_alterar_credenciados
+
+from models import Credenciado
+
+
+
+RAIO_TERRA_KM = 6371.0088
+
+
+
+def caixa_delimitadora(lat, lng, raio_km):
+
+    """Retorna (lat_min, lat_max, lng_min, lng_max) que contém o círculo de raio_km em torno do ponto"""
+
+    delta_lat = math.degrees(raio_km / RAIO_TERRA_KM)
+
+    lat_min = max(lat - delta_lat, -90.0)
+
+    lat_max = min(lat + delta_lat, 90.0)
+
+    
+
+    cos_lat = math.cos(math.radians(max(abs(lat_min), abs(lat_max))))
+
+    if cos_lat < 1e-9:
+
+        return lat_min, lat_max, -180.0, 180.0
+
+    delta_lng = math.degrees(raio_km / (RAIO_TERRA_KM * cos_lat))
+
+    if delta_lng >= 180.0:
+
+        return lat_min, lat_max, -180.0, 180.0
+
+    return lat_min, lat_max, lng - delta_lng, lng + delta_lng
+
+
+
+def haversine_km(lat, lng, lats, lngs):
+
+    """Distância em km do ponto (lat, lng) até cada par de lats/lngs (arrays NumPy)"""
+
+    lat1 = math.radians(lat)
+
+    lat2 = np.radians(lats)
+
+    dlat = lat2 - lat1
+
+    dlng = np.radians(lngs) - math.radians(lng)
+
+    a = np.sin(dlat / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin(dlng / 2) ** 2
+
+    return 2 * RAIO_TERRA_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+
+TAMANHO_CELULA_POR_TILE = 4
+
+ZOOM_MAXIMO = 20
+
+
+
+def tamanho_celula(zoom):
+
+    """Lado da célula da grade em graus para o zoom (4 células por tile de mapa)"""
+
+    return 360.0 / (2 ** zoom) / TAMANHO_CELULA_POR_TILE
+
+
+
+class CacheClusters:
+
+    """Pontos dos credenciados em memória e grades agregadas por zoom, descartados após escritas"""
+
+
+
+    def __init__(self):
+
+        self._lock = threading.Lock()
+
+        self._pontos = None
+
+        self._por_zoom = {}
+
+
+
+    def invalidar(self):
+
+        with self._lock:
+
+            self._pontos = None
+
+            self._por_zoom = {}
+
+
+
+    def _carregar_pontos(self, db):
+
+        rows = db.execute(
+
+            select(Credenciado.id, Credenciado.latitude, Credenciado.longitude, Credenciado.status_busca, Credenciado.status)
+
+            .where(Credenciado.latitude.isnot(None), Credenciado.longitude.isnot(None))
+
+        ).all()
+
+        n = len(rows)
+
+        ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=n)
+
+        lats = np.fromiter((float(r[1]) for r in rows), dtype=np.float64, count=n)
+
+        lngs = np.fromiter((float(r[2]) for r in rows), dtype=np.float64, count=n)
+
+        codigos = {}
+
+        rotulos = []
+
+        status = np.empty(n, dtype=np.int64)
+
+        for i, r in enumerate(rows):
+
+            chave = r[3] or ''
+
+            if chave not in codigos:
+
+                codigos[chave] = len(rotulos)
+
+                rotulos.append(r[4])
+
+            status[i] = codigos[chave]
+
+        return ids, lats, lngs, status, rotulos
+
+
+
+    def _agregar(self, zoom):
+
+        ids, lats, lngs, status, rotulos = self._pontos
+
+        if len(ids) == 0:
+
+            return None
+
+        lado = tamanho_celula(zoom)
+
+        colunas = np.floor((lngs + 180.0) / lado).astype(np.int64)
+
+        linhas = np.floor((lats + 90.0) / lado).astype(np.int64)
+
+        largura = int(np.ceil(360.0 / lado)) + 1
+
+        celula = linhas * largura + colunas
+
+        
+
+        chaves, primeiro, inverso, contagem = np.unique(
+
+            celula, return_index=True, return_inverse=True, return_counts=True
+
+        )
+
+        soma_lat = np.bincount(inverso, weights=lats)
+
+        soma_lng = np.bincount(inverso, weights=lngs)
+
+        
+
+        n_status = max(len(rotulos), 1)
+
+        por_status = np.bincount(inverso * n_status + status, minlength=len(chaves) * n_status)
+
+        dominante = por_status.reshape(len(chaves), n_status).argmax(axis=1)
+
+        
+
+        return {
+
+            "lat": soma_lat / contagem,
+
+            "lng": soma_lng / contagem,
+
+            "count": contagem,
+
+            "status": dominante,
+
+            "id": ids[primeiro],
+
+            "rotulos": rotulos,
+
+        }
+
+
+
+    def grade(self, db, zoom):
+
+        with self._lock:
+
+            if self._pontos is None:
+
+                self._pontos = self._carregar_pontos(db)
+
+            if zoom not in self._por_zoom:
+
+                self._por_zoom[zoom] = self._agregar(zoom)
+
+            return self._por_zoom[zoom]
+
+
+
+    def clusters(self, db, zoom, bbox):
+
+        """Clusters do zoom com centróide dentro de bbox (lng_min, lat_min, lng_max, lat_max)"""
+
+        grade = self.grade(db, zoom)
+
+        if grade is None:
+
+            return []
+
+        lng_min, lat_min, lng_max, lat_max = bbox
+
+        dentro = (grade["lat"] >= lat_min) & (grade["lat"] <= lat_max)
+
+        if lng_min <= lng_max:
+
+            dentro &= (grade["lng"] >= lng_min) & (grade["lng"] <= lng_max)
+
+        else:
+
+            dentro &= (grade["lng"] >= lng_min) | (grade["lng"] <= lng_max)
+
+        
+
+        indices = np.flatnonzero(dentro)
+
+        rotulos = grade["rotulos"] or [None]
+
+        clusters = []
+
+        for lat, lng, count, status, credenciado_id in zip(
+
+            np.round(grade["lat"][indices], 6).tolist(),
+
+            np.round(grade["lng"][indices], 6).tolist(),
+
+            grade["count"][indices].tolist(),
+
+            grade["status"][indices].tolist(),
+
+            grade["id"][indices].tolist(),
+
+        ):
+
+            cluster = {"latitude": lat, "longitude": lng, "count": count, "status": rotulos[status]}
+
+            if count == 1:
+
+                cluster["id"] = credenciado_id
+
+            clusters.append(cluster)
+
+        return clusters
+
+
+
+cache_clusters = CacheClusters()
+
+
+
+@ao_alterar_credenciados
+
+def _invalidar_clusters(db, ids):
+
+    cache_clusters.invalidar()
+
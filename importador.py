@@ -0,0 +1,921 @@
+"""
+Etapas do importador de planilhas de credenciados usadas por blueprints/importacoes.py.
+O upload só agenda a importação; processar_importacao roda em um pool de workers e grava
+o andamento na linha da tabela importacao a cada lote.
+"""
+
+
+
+import codecs
+
+import json
+
+import os
+
+import traceback
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+
+import pandas as pd
+
+from sqlalchemy import func, insert, select, text, update
+
+
+
+from caches import notificar_alteracao
+
+from database import db_session, engine
+
+from models import CAMPOS_BUSCA, Credenciado, Importacao, campos_busca, normalizar_texto
+
+from outbox import registrar_eventos
+
+
+
+LOTE_CARGA_INDICE = 10000
+
+LOTE_ESCRITA = int(os.getenv('IMPORTACAO_LOTE_ESCRITA', '1000'))
+
+LOTE_LEITURA = int(os.getenv('IMPORTACAO_LOTE_LEITURA', '10000'))
+
+BLOCO_EXAME = 1024 * 1024
+
+WORKERS_IMPORTACAO = int(os.getenv('IMPORTACAO_WORKERS', '2'))
+
+MAX_ERROS_GUARDADOS = 10
+
+COLUNAS_PLANILHA = [
+
+    'nome', 'crm', 'telefone', 'email', 'status', 'tipo', 'logradouro', 'bairro', 'numero',
+
+    'cidade', 'estado', 'cep', 'complexidade', 'credenciamento',
+
+]
+
+CAMPOS_LINHA = (
+
+    'nome', 'crm', 'telefone', 'email', 'status', 'tipo', 'logradouro', 'bairro', 'numero',
+
+    'cidade', 'estado', 'cep', 'complexidade',
+
+)
+
+ALIASES_CODIGO = ('credenciamento', 'codigo', 'cod', 'id_credenciamento', 'id')
+
+
+
+def _texto(serie):
+
+    """str(valor).strip() na coluna inteira; vazios do pandas (NaN/None) ficam como NA"""
+
+    return serie.astype(str).str.strip().where(serie.notna())
+
+
+
+def _codigo(serie):
+
+    """Código de credenciamento canônico na coluna inteira: vazio -> NA e número inteiro com casas
+    decimais zeradas sem elas ("123.0" -> "123", como vem de células numéricas); demais valores como escritos"""
+
+    texto = _texto(serie)
+
+    texto = texto.where(texto != '')
+
+    inteiro = texto.str.extract(r'^(\d+)\.0+$', expand=False)
+
+    return texto.where(inteiro.isna(), inteiro).astype(object)
+
+
+
+def normalizar_planilha(df):
+
+    """Normaliza a planilha (ou um bloco dela) de uma vez, coluna a coluna, antes da correspondência.
+    Retorna um DataFrame com 'codigo' (primeiro alias preenchido) e CAMPOS_LINHA, com None nos vazios;
+    colunas ausentes na planilha ficam None"""
+
+    linhas = pd.DataFrame(index=df.index)
+
+    codigo = pd.Series(pd.NA, index=df.index, dtype=object)
+
+    for alias in ALIASES_CODIGO:
+
+        if alias in df.columns:
+
+            codigo = codigo.where(codigo.notna(), _codigo(df[alias]))
+
+    linhas['codigo'] = codigo
+
+    for campo in CAMPOS_LINHA:
+
+        linhas[campo] = _texto(df[campo]) if campo in df.columns else pd.NA
+
+    return linhas.astype(object).where(linhas.notna(), None)
+
+
+
+def _adicionar(mapa, chave, credenciado_id):
+
+    if chave is None:
+
+        return
+
+    atual = mapa.get(chave)
+
+    if atual is None:
+
+        mapa[chave] = credenciado_id
+
+    elif isinstance(atual, set):
+
+        atual.add(credenciado_id)
+
+    else:
+
+        mapa[chave] = {atual, credenciado_id}
+
+
+
+def _remover(mapa, chave, credenciado_id):
+
+    atual = mapa.get(chave)
+
+    if isinstance(atual, set):
+
+        atual.discard(credenciado_id)
+
+        if len(atual) == 1:
+
+            mapa[chave] = next(iter(atual))
+
+    elif atual == credenciado_id:
+
+        del mapa[chave]
+
+
+
+def _unico(mapa, chave):
+
+    """Id do único credenciado com a chave, ou None se não houver ou houver mais de um"""
+
+    atual = mapa.get(chave)
+
+    return atual if isinstance(atual, int) else None
+
+
+
+class IndiceCorrespondencia:
+
+    """Chaves de correspondência do cadastro em memória, carregadas uma vez por importação.
+    Reproduz as consultas que o importador fazia por linha: código -> menor id com o código;
+    crm, email, telefone e nome(+cidade) -> id somente se houver exatamente um candidato.
+    As escritas entram no índice quando entravam no banco: inserções na hora (id provisório, trocado
+    pelo real com renumerar() após a gravação) e atualizações pendentes junto com a próxima inserção."""
+
+
+
+    CAMPOS = ('credenciamento', 'crm', 'email', 'telefone', 'nome', 'cidade')
+
+
+
+    def __init__(self, comparar_sem_acento=False):
+
+        self._chave = normalizar_texto if comparar_sem_acento else (lambda valor: valor)
+
+        self._mapas = {campo: {} for campo in ('credenciamento', 'crm', 'email', 'telefone', 'nome', 'nome_cidade')}
+
+        self._valores = {}
+
+        self._pendentes = {}
+
+        self.ultimo_id = 0
+
+
+
+    @classmethod
+
+    def carregar(cls, db):
+
+        """Lê só as colunas de correspondência, em lotes por id. No MySQL as comparações seguem a collation
+        (sem caixa/acentos), então as chaves são normalizadas do mesmo jeito"""
+
+        indice = cls(comparar_sem_acento=db.get_bind().dialect.name == 'mysql')
+
+        colunas = [getattr(Credenciado, campo) for campo in cls.CAMPOS]
+
+        while True:
+
+            linhas = db.execute(
+
+                select(Credenciado.id, *colunas)
+
+                .where(Credenciado.id > indice.ultimo_id)
+
+                .order_by(Credenciado.id)
+
+                .limit(LOTE_CARGA_INDICE)
+
+            ).all()
+
+            if not linhas:
+
+                break
+
+            for linha in linhas:
+
+                indice._indexar(linha[0], dict(zip(cls.CAMPOS, linha[1:])))
+
+            indice.ultimo_id = linhas[-1][0]
+
+        return indice
+
+
+
+    def _chaves(self, valores):
+
+        chave = self._chave
+
+        nome = chave(valores.get('nome'))
+
+        cidade = chave(valores.get('cidade'))
+
+        return {
+
+            'credenciamento': chave(valores.get('credenciamento')),
+
+            'crm': chave(valores.get('crm')),
+
+            'email': chave(valores.get('email')),
+
+            'telefone': chave(valores.get('telefone')),
+
+            'nome': nome,
+
+            'nome_cidade': (nome, cidade) if nome is not None and cidade is not None else None,
+
+        }
+
+
+
+    def _indexar(self, credenciado_id, valores):
+
+        self._valores[credenciado_id] = valores
+
+        for campo, chave in self._chaves(valores).items():
+
+            _adicionar(self._mapas[campo], chave, credenciado_id)
+
+
+
+    def _desindexar(self, credenciado_id):
+
+        valores = self._valores.pop(credenciado_id, None)
+
+        if valores is None:
+
+            return {}
+
+        for campo, chave in self._chaves(valores).items():
+
+            _remover(self._mapas[campo], chave, credenciado_id)
+
+        return valores
+
+
+
+    def encontrar(self, codigo, payload):
+
+        """Id do credenciado correspondente à linha, na mesma precedência do importador, ou None"""
+
+        chave = self._chave
+
+        if codigo:
+
+            candidatos = self._mapas['credenciamento'].get(chave(codigo))
+
+            if candidatos is not None:
+
+                return min(candidatos) if isinstance(candidatos, set) else candidatos
+
+            campos = ('crm', 'email', 'telefone')
+
+        else:
+
+            campos = ('crm', 'email')
+
+
+
+        for campo in campos:
+
+            valor = payload.get(campo)
+
+            if valor:
+
+                encontrado = _unico(self._mapas[campo], chave(valor))
+
+                if encontrado is not None:
+
+                    return encontrado
+
+
+
+        nome = payload.get('nome')
+
+        if codigo and nome:
+
+            cidade = payload.get('cidade')
+
+            if cidade:
+
+                return _unico(self._mapas['nome_cidade'], (chave(nome), chave(cidade)))
+
+            return _unico(self._mapas['nome'], chave(nome))
+
+        return None
+
+
+
+    def atualizado(self, credenciado_id, valores):
+
+        """Registra a atualização; ela passa a valer para as buscas na próxima inserção"""
+
+        self._pendentes.setdefault(credenciado_id, {}).update({c: valores[c] for c in self.CAMPOS if c in valores})
+
+
+
+    def inserido(self, credenciado_id, valores):
+
+        """Aplica as atualizações pendentes e indexa o novo credenciado"""
+
+        for pendente_id, novos in self._pendentes.items():
+
+            self._indexar(pendente_id, {**self._desindexar(pendente_id), **novos})
+
+        self._pendentes = {}
+
+        self._indexar(credenciado_id, {campo: valores.get(campo) for campo in self.CAMPOS})
+
+
+
+    def renumerar(self, ids_reais):
+
+        """Troca ids provisórios pelos reais ({provisório: real}); desindexa todos antes, pois os números podem se cruzar"""
+
+        valores = {provisorio: self._desindexar(provisorio) for provisorio in ids_reais}
+
+        for provisorio, credenciado_id in ids_reais.items():
+
+            self._indexar(credenciado_id, valores[provisorio])
+
+        self._pendentes = {ids_reais.get(i, i): novos for i, novos in self._pendentes.items()}
+
+
+
+class GravacaoEmLote:
+
+    """Etapa de escrita do importador: acumula inserções e atualizações até `tamanho` linhas (cheio)
+    e as grava com gravar(), com um INSERT em lote (executemany) e um UPDATE em lote por id. Linhas novas recebem no índice
+    um id provisório (acima de todo id do índice), então linhas seguintes da planilha as encontram antes de irem ao banco;
+    os ids reais são lidos depois pela marca id_importacao, na ordem de inserção, e substituem os provisórios no índice"""
+
+
+
+    def __init__(self, db, indice, importacao_id, tamanho=LOTE_ESCRITA):
+
+        self.db = db
+
+        self.indice = indice
+
+        self.importacao_id = importacao_id
+
+        self.tamanho = max(1, tamanho)
+
+        self._ultimo_inserido = 0
+
+        self._proximo_provisorio = indice.ultimo_id + 1
+
+        self._novos = {}
+
+        self._atualizacoes = {}
+
+
+
+    def inserir(self, valores):
+
+        provisorio = self._proximo_provisorio
+
+        self._proximo_provisorio += 1
+
+        self._novos[provisorio] = dict(valores)
+
+        self.indice.inserido(provisorio, valores)
+
+
+
+    def atualizar(self, credenciado_id, valores):
+
+        self.indice.atualizado(credenciado_id, valores)
+
+        if credenciado_id in self._novos:
+
+            self._novos[credenciado_id].update(valores)
+
+        else:
+
+            self._atualizacoes.setdefault(credenciado_id, {}).update(valores)
+
+
+
+    @property
+
+    def cheio(self):
+
+        return len(self._novos) + len(self._atualizacoes) >= self.tamanho
+
+
+
+    def gravar(self):
+
+        """Grava o lote pendente e registra os eventos no outbox, um por credenciado do lote; o commit fica com quem chama"""
+
+        eventos = []
+
+        if self._novos:
+
+            provisorios = sorted(self._novos, key=lambda provisorio: sorted(self._novos[provisorio]))
+
+            self.db.execute(insert(Credenciado), [
+
+                {
+
+                    **self._novos[provisorio],
+
+                    **campos_busca({campo: self._novos[provisorio].get(campo) for campo in CAMPOS_BUSCA}),
+
+                    'id_importacao': self.importacao_id,
+
+                }
+
+                for provisorio in provisorios
+
+            ])
+
+            ids = self.db.scalars(
+
+                select(Credenciado.id)
+
+                .where(Credenciado.id_importacao == self.importacao_id, Credenciado.id > self._ultimo_inserido)
+
+                .order_by(Credenciado.id)
+
+            ).all()
+
+            self.indice.renumerar(dict(zip(provisorios, ids)))
+
+            eventos.extend(('insert', credenciado_id, None) for credenciado_id in ids)
+
+            self._ultimo_inserido = ids[-1]
+
+            self._proximo_provisorio = max(self._proximo_provisorio, ids[-1] + 1)
+
+        if self._atualizacoes:
+
+            linhas = [
+
+                {'id': credenciado_id, **valores, **campos_busca(valores)}
+
+                for credenciado_id, valores in self._atualizacoes.items()
+
+            ]
+
+            linhas.sort(key=lambda linha: sorted(linha))
+
+            self.db.execute(update(Credenciado), linhas)
+
+            eventos.extend(('update', credenciado_id, None) for credenciado_id in self._atualizacoes)
+
+        registrar_eventos(self.db, eventos)
+
+        self._novos = {}
+
+        self._atualizacoes = {}
+
+
+
+_executor = ThreadPoolExecutor(max_workers=WORKERS_IMPORTACAO, thread_name_prefix='importacao')
+
+
+
+def agendar_importacao(importacao_id, caminho, nome_arquivo):
+
+    """Coloca a importação na fila do pool de workers"""
+
+    return _executor.submit(processar_importacao, importacao_id, caminho, nome_arquivo)
+
+
+
+def _salvar_progresso(importacao_id, **valores):
+
+    """Grava o andamento em transação própria, para ficar visível enquanto a importação roda"""
+
+    try:
+
+        with engine.begin() as conn:
+
+            conn.execute(
+
+                update(Importacao.__table__)
+
+                .where(Importacao.__table__.c.id == importacao_id)
+
+                .values(**valores)
+
+            )
+
+    except Exception as e:
+
+        print(f"[v0] Aviso: não foi possível gravar o progresso da importação {importacao_id}: {e}")
+
+
+
+def marcar_importacoes_interrompidas():
+
+    """Na inicialização, marca como 'erro' as importações 'pendente'/'processando' que ficaram órfãs:
+    os jobs vivem só no pool deste processo, então nenhum deles sobrevive a um reinício"""
+
+    try:
+
+        with engine.begin() as conn:
+
+            total = conn.execute(
+
+                update(Importacao.__table__)
+
+                .where(Importacao.__table__.c.status.in_(('pendente', 'processando')))
+
+                .values(
+
+                    status='erro',
+
+                    mensagem='Importação interrompida: o servidor reiniciou antes de concluir. Envie o arquivo novamente',
+
+                    concluido_em=func.now(),
+
+                )
+
+            ).rowcount
+
+        if total:
+
+            print(f"[v0] Aviso: {total} importação(ões) interrompida(s) marcada(s) como erro")
+
+    except Exception as e:
+
+        print(f"[v0] Aviso: não foi possível verificar importações interrompidas: {e}")
+
+
+
+def _garantir_coluna_credenciamento():
+
+    try:
+
+        with engine.connect() as conn:
+
+            exists = conn.execute(
+
+                text(
+
+                    """
+                    SELECT COUNT(*)
+                    FROM INFORMATION_SCHEMA.COLUMNS
+                    WHERE TABLE_SCHEMA = DATABASE()
+                      AND TABLE_NAME = 'credenciado'
+                      AND COLUMN_NAME = 'credenciamento'
+                    """
+
+                )
+
+            ).scalar()
+
+            if not exists:
+
+                print("[v0] Coluna 'credenciamento' não existe. Criando coluna...")
+
+                conn.execute(text("ALTER TABLE credenciado ADD COLUMN credenciamento VARCHAR(50) NULL"))
+
+                
+
+                try:
+
+                    conn.execute(text("CREATE INDEX idx_credenciado_credenciamento ON credenciado(credenciamento)"))
+
+                except Exception:
+
+                    pass
+
+                print("[v0] ✓ Coluna 'credenciamento' criada")
+
+    except Exception as e:
+
+        
+
+        print(f"[v0] Aviso: não foi possível garantir coluna 'credenciamento': {e}")
+
+
+
+def examinar_csv(caminho):
+
+    """(codificação, estimativa de linhas de dados) do CSV em uma única leitura, sem carregar o arquivo:
+    'utf-8' se o arquivo inteiro decodifica como UTF-8, senão 'latin-1'; as linhas vêm das quebras de linha"""
+
+    decodificador = codecs.getincrementaldecoder('utf-8')()
+
+    quebras, ultimo = 0, b''
+
+    with open(caminho, 'rb') as arquivo:
+
+        for bloco in iter(lambda: arquivo.read(BLOCO_EXAME), b''):
+
+            quebras += bloco.count(b'\n')
+
+            ultimo = bloco[-1:]
+
+            if decodificador is not None:
+
+                try:
+
+                    decodificador.decode(bloco)
+
+                except UnicodeDecodeError:
+
+                    decodificador = None
+
+    if decodificador is not None:
+
+        try:
+
+            decodificador.decode(b'', final=True)
+
+        except UnicodeDecodeError:
+
+            decodificador = None
+
+    if ultimo and ultimo != b'\n':
+
+        quebras += 1
+
+    return ('utf-8' if decodificador is not None else 'latin-1'), max(quebras - 1, 0)
+
+
+
+def _normalizar_colunas(df):
+
+    df.columns = df.columns.str.strip().str.lower()
+
+    return df
+
+
+
+def abrir_planilha(caminho):
+
+    """(colunas normalizadas, total de linhas, iterador de blocos de até LOTE_LEITURA linhas).
+    CSV é lido em streaming com chunksize, na codificação escolhida antes de qualquer escrita; todas as colunas
+    vêm como str, para que os valores não dependam dos tipos inferidos em cada bloco.
+    Excel não tem leitura em blocos no pandas: é lido inteiro e fatiado"""
+
+    if caminho.endswith('.csv'):
+
+        codificacao, total_linhas = examinar_csv(caminho)
+
+        print(f"[v0] Codificação detectada: {codificacao}")
+
+        originais = pd.read_csv(caminho, encoding=codificacao, nrows=0).columns
+
+        leitor = pd.read_csv(caminho, encoding=codificacao, dtype=str, chunksize=LOTE_LEITURA)
+
+        colunas = [str(original).strip().lower() for original in originais]
+
+        return colunas, total_linhas, (_normalizar_colunas(bloco) for bloco in leitor)
+
+    
+
+    df = _normalizar_colunas(pd.read_excel(caminho))
+
+    blocos = (df.iloc[inicio:inicio + LOTE_LEITURA] for inicio in range(0, len(df), LOTE_LEITURA))
+
+    return df.columns.tolist(), len(df), blocos
+
+
+
+def _registrar_erro(erros, contadores, mensagem):
+
+    """Conta o erro e guarda só as primeiras MAX_ERROS_GUARDADOS mensagens"""
+
+    contadores['total_erros'] += 1
+
+    if len(erros) < MAX_ERROS_GUARDADOS:
+
+        erros.append(mensagem)
+
+
+
+def processar_importacao(importacao_id, caminho, nome_arquivo):
+
+    """Lê a planilha em blocos de LOTE_LEITURA linhas e, para cada bloco, normaliza, casa e grava.
+    Cada lote de escrita (LOTE_ESCRITA) é confirmado logo após gravado, para que as transações durem
+    bem menos que o ATRASO_SEGUNDOS de quem lê o outbox e a sincronização; o progresso sai por bloco.
+    Os dados das linhas ficam limitados ao bloco; o que cresce com o arquivo são só o índice de correspondência
+    (uma entrada por credenciado, existente ou inserido) e o conjunto de códigos já vistos.
+    Se falhar no meio, os blocos já confirmados permanecem e a importação fica com status 'erro'"""
+
+    print(f"[v0] ========== INICIANDO IMPORTAÇÃO {importacao_id} ==========")
+
+    _salvar_progresso(importacao_id, status='processando', iniciado_em=func.now())
+
+    db = db_session()
+
+    contadores = {
+
+        'linhas_processadas': 0,
+
+        'registros_importados': 0,
+
+        'registros_atualizados': 0,
+
+        'duplicados_ignorados': 0,
+
+        'total_erros': 0,
+
+    }
+
+    erros = []
+
+    gravou = False
+
+    try:
+
+        colunas, total_linhas, blocos = abrir_planilha(caminho)
+
+        print(f"[v0] Colunas normalizadas: {colunas}")
+
+        colunas_faltando = [col for col in ['nome'] if col not in colunas]
+
+        if colunas_faltando:
+
+            raise ValueError(
+
+                f"Colunas obrigatórias faltando: {', '.join(colunas_faltando)}. "
+
+                f"Encontradas: {', '.join(colunas)}. Esperadas: {', '.join(COLUNAS_PLANILHA)}"
+
+            )
+
+        _garantir_coluna_credenciamento()
+
+        _salvar_progresso(importacao_id, total_linhas=total_linhas)
+
+        
+
+        indice = IndiceCorrespondencia.carregar(db)
+
+        gravacao = GravacaoEmLote(db, indice, importacao_id)
+
+        print("[v0] ✓ Índice de correspondência carregado")
+
+        vistos_no_arquivo = set()
+
+        
+
+        for bloco in blocos:
+
+            linhas = normalizar_planilha(bloco)
+
+            for index, (codigo, *campos) in zip(linhas.index, linhas.itertuples(index=False, name=None)):
+
+                try:
+
+                    print(f"[v0] Processando linha {index + 1}/{total_linhas}")
+
+                    
+
+                    payload = dict(zip(CAMPOS_LINHA, campos))
+
+                    if not payload['nome']:
+
+                        _registrar_erro(erros, contadores, f"Linha {index + 2}: Nome é obrigatório")
+
+                        continue
+
+                    
+
+                    if codigo and codigo in vistos_no_arquivo:
+
+                        contadores['duplicados_ignorados'] += 1
+
+                        print(f"[v0] • Duplicado no arquivo detectado para código {codigo}; ignorando esta linha")
+
+                        continue
+
+                    
+
+                    if codigo:
+
+                        vistos_no_arquivo.add(codigo)
+
+                    credenciado_id = indice.encontrar(codigo, payload)
+
+                    valores = {**payload, 'credenciamento': codigo} if codigo else payload
+
+                    
+
+                    if credenciado_id:
+
+                        gravacao.atualizar(credenciado_id, valores)
+
+                        print(f"[v0] ↻ Atualizando credenciado existente para código {codigo}")
+
+                        contadores['registros_atualizados'] += 1
+
+                    else:
+
+                        gravacao.inserir({**payload, 'credenciamento': codigo})
+
+                        print(f"[v0] ✓ Novo credenciado (código {codigo}) na fila de inserção")
+
+                        contadores['registros_importados'] += 1
+
+                
+
+                except Exception as e:
+
+                    erro_msg = f"Linha {index + 2}: {str(e)}"
+
+                    print(f"[v0] ✗ ERRO: {erro_msg}")
+
+                    _registrar_erro(erros, contadores, erro_msg)
+
+                
+
+                if gravacao.cheio:
+
+                    gravacao.gravar()
+
+                    db.commit()
+
+                    gravou = True
+
+            
+
+            gravacao.gravar()
+
+            db.commit()
+
+            gravou = True
+
+            contadores['linhas_processadas'] += len(linhas)
+
+            _salvar_progresso(importacao_id, **contadores, erros=json.dumps(erros))
+
+            print(f"[v0] ✓ Bloco confirmado: {contadores['linhas_processadas']}/{total_linhas} linhas")
+
+        
+
+        total_linhas = contadores['linhas_processadas']
+
+        _salvar_progresso(
+
+            importacao_id,
+
+            status='concluida',
+
+            total_linhas=total_linhas,
+
+            descricao=f"Importação de arquivo: {nome_arquivo} ({total_linhas} registros)"[:150],
+
+            concluido_em=func.now(),
+
+        )
+
+        print(f"[v0] ========== IMPORTAÇÃO {importacao_id} CONCLUÍDA ==========")
+
+        print(f"[v0] Registros importados: {contadores['registros_importados']}, atualizados: {contadores['registros_atualizados']}")
+
+    except Exception as e:
+
+        db.rollback()
+
+        print(f"[v0] ✗ ERRO GERAL na importação {importacao_id}: {str(e)}")
+
+        traceback.print_exc()
+
+        _salvar_progresso(importacao_id, status='erro', mensagem=str(e), concluido_em=func.now())
+
+    finally:
+
+        if gravou:
+
+            notificar_alteracao(db)
+
+        db_session.remove()
+
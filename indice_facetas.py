@@ -0,0 +1,355 @@
+"""
+Índice de facetas em memória (bitsets) para especialidade, rede, diferencial, status e estado.
+Cada valor de faceta guarda um int Python usado como bitset dos ids de credenciado, de modo que
+interseções e contagens são operações &, | e bit_count, sem consultar o banco.
+Opcional: carregado na inicialização quando INDICE_FACETAS=1.
+"""
+
+
+
+import os
+
+import threading
+
+from collections import defaultdict
+
+import numpy as np
+
+from sqlalchemy import select
+
+from caches import ao_alterar_credenciados
+
+from models import (
+
+    Credenciado, CredenciadoEspecialidade, CredenciadoDiferencial, CredenciadoRede,
+
+    Especialidade, Diferencial, Rede
+
+)
+
+
+
+HABILITADO = os.getenv('INDICE_FACETAS', '0') == '1'
+
+
+
+ASSOCIACOES = {
+
+    'especialidades': (CredenciadoEspecialidade, CredenciadoEspecialidade.id_especialidade, Especialidade, 'descricao'),
+
+    'redes': (CredenciadoRede, CredenciadoRede.id_rede, Rede, 'nome'),
+
+    'diferenciais': (CredenciadoDiferencial, CredenciadoDiferencial.id_diferencial, Diferencial, 'descricao'),
+
+}
+
+DIMENSOES = tuple(ASSOCIACOES) + ('status', 'estados')
+
+
+
+def _bitset(ids):
+
+    """Converte uma sequência de ids em um int com os bits correspondentes ligados;
+    o custo acompanha a faixa entre o menor e o maior id, não o maior id"""
+
+    ids = np.asarray(ids, dtype=np.int64)
+
+    if ids.size == 0:
+
+        return 0
+
+    base = int(ids.min())
+
+    bits = np.zeros(int(ids.max()) - base + 1, dtype=bool)
+
+    bits[ids - base] = True
+
+    return int.from_bytes(np.packbits(bits, bitorder='little').tobytes(), 'little') << base
+
+
+
+class IndiceFacetas:
+
+
+
+    def __init__(self):
+
+        self._lock = threading.Lock()
+
+        self._bits = {}
+
+        self._todos = 0
+
+        self._chaves_por_id = {}
+
+        self._rotulos = {}
+
+        self.carregado = False
+
+
+
+    def _ler_chaves(self, db, ids=None):
+
+        """Retorna ({id: set((dimensão, valor))}, {status normalizado: rótulo}) lidos do banco, para todos ou só para os ids"""
+
+        chaves = defaultdict(set)
+
+        rotulos_status = {}
+
+        query = select(Credenciado.id, Credenciado.status_busca, Credenciado.status, Credenciado.estado)
+
+        if ids is not None:
+
+            query = query.where(Credenciado.id.in_(ids))
+
+        for credenciado_id, status, rotulo, estado in db.execute(query):
+
+            chaves[credenciado_id].add(('status', status))
+
+            chaves[credenciado_id].add(('estados', estado))
+
+            rotulos_status[status] = rotulo
+
+        
+
+        for dimensao, (modelo, coluna, _, _) in ASSOCIACOES.items():
+
+            query = select(modelo.id_credenciado, coluna)
+
+            if ids is not None:
+
+                query = query.where(modelo.id_credenciado.in_(ids))
+
+            for credenciado_id, valor in db.execute(query):
+
+                if credenciado_id in chaves and valor is not None:
+
+                    chaves[credenciado_id].add((dimensao, valor))
+
+        return chaves, rotulos_status
+
+
+
+    def _ler_rotulos(self, db, faltando=None):
+
+        """Rótulos dos catálogos: todos ou, com faltando={dimensão: ids}, só os desses ids"""
+
+        rotulos = {}
+
+        for dimensao, (_, _, tabela, atributo) in ASSOCIACOES.items():
+
+            query = select(tabela.id, getattr(tabela, atributo))
+
+            if faltando is not None:
+
+                if not faltando.get(dimensao):
+
+                    continue
+
+                query = query.where(tabela.id.in_(faltando[dimensao]))
+
+            rotulos[dimensao] = {i: r for i, r in db.execute(query)}
+
+        return rotulos
+
+
+
+    def carregar(self, db):
+
+        chaves, rotulos_status = self._ler_chaves(db)
+
+        rotulos = self._ler_rotulos(db)
+
+        rotulos['status'] = rotulos_status
+
+        membros = defaultdict(list)
+
+        for credenciado_id, chaves_id in chaves.items():
+
+            for chave in chaves_id:
+
+                membros[chave].append(credenciado_id)
+
+        bits = {chave: _bitset(ids) for chave, ids in membros.items()}
+
+        with self._lock:
+
+            self._bits = bits
+
+            self._todos = _bitset(list(chaves))
+
+            self._chaves_por_id = dict(chaves)
+
+            self._rotulos = rotulos
+
+            self.carregado = True
+
+        print(f"[v0] ✓ Índice de facetas carregado: {len(chaves)} credenciados, {len(bits)} valores")
+
+
+
+    def atualizar(self, db, ids):
+
+        """Reindexa apenas os ids informados (inclusive removidos); rótulos de status vêm só dessas linhas
+        e só são lidos do catálogo os valores que o índice ainda não conhece (ex.: especialidade recém-criada)"""
+
+        chaves, rotulos_status = self._ler_chaves(db, ids)
+
+        conhecidos = self._rotulos
+
+        faltando = defaultdict(set)
+
+        for chaves_id in chaves.values():
+
+            for dimensao, valor in chaves_id:
+
+                if dimensao in ASSOCIACOES and valor not in conhecidos.get(dimensao, {}):
+
+                    faltando[dimensao].add(valor)
+
+        novos_rotulos = self._ler_rotulos(db, faltando) if faltando else {}
+
+        
+
+        entram = defaultdict(list)
+
+        for credenciado_id, chaves_id in chaves.items():
+
+            for chave in chaves_id:
+
+                entram[chave].append(credenciado_id)
+
+        adicionar = {chave: _bitset(membros) for chave, membros in entram.items()}
+
+        todos_ids = _bitset(list(ids))
+
+        presentes = _bitset(list(chaves))
+
+        
+
+        with self._lock:
+
+            saem = defaultdict(list)
+
+            for credenciado_id in ids:
+
+                for chave in self._chaves_por_id.pop(credenciado_id, ()):
+
+                    saem[chave].append(credenciado_id)
+
+            for chave in saem.keys() | adicionar.keys():
+
+                bits = self._bits.get(chave, 0)
+
+                if chave in saem:
+
+                    bits &= ~_bitset(saem[chave])
+
+                self._bits[chave] = bits | adicionar.get(chave, 0)
+
+            self._todos = (self._todos & ~todos_ids) | presentes
+
+            self._chaves_por_id.update(chaves)
+
+            rotulos = {**self._rotulos, 'status': {**self._rotulos.get('status', {}), **rotulos_status}}
+
+            for dimensao, valores in novos_rotulos.items():
+
+                rotulos[dimensao] = {**rotulos.get(dimensao, {}), **valores}
+
+            self._rotulos = rotulos
+
+
+
+    def _filtro(self, filtros, modo):
+
+        """Bitset dos credenciados que atendem {dimensão: [valores]} (modo or/and dentro da dimensão)"""
+
+        resultado = self._todos
+
+        for dimensao, valores in filtros.items():
+
+            conjuntos = [self._bits.get((dimensao, v), 0) for v in valores]
+
+            if not conjuntos:
+
+                continue
+
+            combinado = conjuntos[0]
+
+            for bits in conjuntos[1:]:
+
+                combinado = combinado & bits if modo == 'and' else combinado | bits
+
+            resultado &= combinado
+
+        return resultado
+
+
+
+    def facetas(self, filtros, modo='or'):
+
+        """Mesmo formato de contagens do cálculo por SQL, respondido só com operações de bits"""
+
+        with self._lock:
+
+            filtro = self._filtro(filtros, modo)
+
+            contagens = defaultdict(list)
+
+            for (dimensao, valor), bits in self._bits.items():
+
+                n = (filtro & bits).bit_count()
+
+                if n:
+
+                    contagens[dimensao].append((valor, n))
+
+            rotulos = self._rotulos
+
+        
+
+        facetas = {}
+
+        for dimensao, (_, _, _, atributo) in ASSOCIACOES.items():
+
+            itens = sorted(contagens[dimensao], key=lambda par: (-par[1], par[0]))
+
+            facetas[dimensao] = [
+
+                {"id": valor, atributo: rotulos[dimensao].get(valor), "count": n} for valor, n in itens
+
+            ]
+
+        itens = sorted(contagens['status'], key=lambda par: -par[1])
+
+        facetas['status'] = [{"status": rotulos['status'].get(valor), "count": n} for valor, n in itens]
+
+        itens = sorted(contagens['estados'], key=lambda par: -par[1])
+
+        facetas['estados'] = [{"estado": valor, "count": n} for valor, n in itens]
+
+        return facetas
+
+
+
+indice_facetas = IndiceFacetas()
+
+
+
+@ao_alterar_credenciados
+
+def _atualizar_indice_facetas(db, ids):
+
+    if not indice_facetas.carregado:
+
+        return
+
+    if ids is None:
+
+        indice_facetas.carregar(db)
+
+    else:
+
+        indice_facetas.atualizar(db, ids)
+
@@ -6,7 +6,15 @@ import os
 
 from flask_jwt_extended import JWTManager
 
-from database import init_db, close_db
+from database import init_db, close_db, engine, db_session
+
+from busca import preencher_campos_busca
+
+from sincronizacao import preencher_ultima_atualizacao
+
+from indice_facetas import indice_facetas, HABILITADO as INDICE_FACETAS_HABILITADO
+
+from importador import marcar_importacoes_interrompidas
 
 from blueprints.auth import auth_bp
 
@@ -72,6 +80,18 @@ def create_app():
 
         init_db()
 
+        marcar_importacoes_interrompidas()
+
+        preencher_campos_busca(engine)
+
+        preencher_ultima_atualizacao(engine)
+
+        if INDICE_FACETAS_HABILITADO:
+
+            indice_facetas.carregar(db_session())
+
+            db_session.remove()
+
     
 
     app.teardown_appcontext(close_db)
@@ -2,18 +2,76 @@ from sqlalchemy import (
 
     Column, Integer, String, Date, DateTime, Boolean, 
 
-    DECIMAL, ForeignKey, Text
+    DECIMAL, ForeignKey, Text, Index
 
 )
 
+import unicodedata
+
+from sqlalchemy import event
+
+from sqlalchemy.dialects import sqlite
+
 from sqlalchemy.orm import relationship
 
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 
 from database import Base
 
 
 
+DATA_HORA_SQLITE = sqlite.DATETIME(
+
+    storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"
+
+)
+
+
+
+CAMPOS_BUSCA = {
+
+    'nome': 'nome_busca',
+
+    'cidade': 'cidade_busca',
+
+    'bairro': 'bairro_busca',
+
+    'status': 'status_busca',
+
+}
+
+
+
+def normalizar_texto(texto):
+
+    """Remove acentos, espaços nas pontas e caixa; usado nas colunas *_busca"""
+
+    if texto is None:
+
+        return None
+
+    decomposto = unicodedata.normalize('NFKD', str(texto).strip())
+
+    return ''.join(c for c in decomposto if not unicodedata.combining(c)).lower()
+
+
+
+def campos_busca(valores):
+
+    """Colunas *_busca correspondentes aos campos presentes em valores (dict)"""
+
+    return {
+
+        sombra: normalizar_texto(valores[campo])
+
+        for campo, sombra in CAMPOS_BUSCA.items()
+
+        if campo in valores
+
+    }
+
+
+
 class Login(Base):
 
     __tablename__ = "login"
@@ -36,6 +94,14 @@ class Credenciado(Base):
 
     __tablename__ = "credenciado"
 
+    __table_args__ = (
+
+        Index('ft_credenciado_busca', 'nome', 'cidade', 'bairro', mysql_prefix='FULLTEXT').ddl_if(dialect='mysql'),
+
+        Index('idx_credenciado_lat_lng', 'latitude', 'longitude'),
+
+    )
+
     
 
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -48,7 +114,7 @@ class Credenciado(Base):
 
     credenciamento = Column(String(50), index=True)
 
-    nome = Column(String(150), nullable=False)
+    nome = Column(String(150), nullable=False, index=True)
 
     crm = Column(String(20))
 
@@ -60,7 +126,13 @@ class Credenciado(Base):
 
     data_contrato = Column(Date)
 
-    ultima_atualizacao = Column(DateTime, default=func.now(), onupdate=func.now())
+    ultima_atualizacao = Column(
+
+        DateTime().with_variant(DATA_HORA_SQLITE, 'sqlite'), default=func.now(), onupdate=func.now(), index=True
+
+    )
+
+    versao = Column(Integer, nullable=False, default=1, server_default='1', onupdate=text('versao + 1'))
 
     complexidade = Column(String(50))
 
@@ -90,6 +162,20 @@ class Credenciado(Base):
 
     
 
+    nome_busca = Column(String(150), index=True)
+
+    cidade_busca = Column(String(100), index=True)
+
+    bairro_busca = Column(String(100), index=True)
+
+    status_busca = Column(String(50), index=True)
+
+    id_importacao = Column(Integer, index=True)
+
+    lote_criacao = Column(String(32), index=True)
+
+    
+
     
 
     especialidades = relationship(
@@ -136,6 +222,18 @@ class Credenciado(Base):
 
 
 
+@event.listens_for(Credenciado, 'before_insert')
+
+@event.listens_for(Credenciado, 'before_update')
+
+def _sincronizar_campos_busca(mapper, connection, target):
+
+    for campo, sombra in CAMPOS_BUSCA.items():
+
+        setattr(target, sombra, normalizar_texto(getattr(target, campo)))
+
+
+
 class Especialidade(Base):
 
     __tablename__ = "especialidade"
@@ -220,6 +318,34 @@ class Importacao(Base):
 
     descricao = Column(String(150))
 
+    
+
+    status = Column(String(20))
+
+    arquivo = Column(String(255))
+
+    total_linhas = Column(Integer)
+
+    linhas_processadas = Column(Integer, default=0)
+
+    registros_importados = Column(Integer, default=0)
+
+    registros_atualizados = Column(Integer, default=0)
+
+    duplicados_ignorados = Column(Integer, default=0)
+
+    total_erros = Column(Integer, default=0)
+
+    erros = Column(Text)
+
+    mensagem = Column(Text)
+
+    criado_em = Column(DateTime, default=func.now())
+
+    iniciado_em = Column(DateTime)
+
+    concluido_em = Column(DateTime)
+
 
 
 class CredenciadoEspecialidade(Base):
@@ -230,7 +356,7 @@ class CredenciadoEspecialidade(Base):
 
     id = Column(Integer, primary_key=True, autoincrement=True)
 
-    id_credenciado = Column(Integer, ForeignKey("credenciado.id", ondelete="CASCADE"))
+    id_credenciado = Column(Integer, ForeignKey("credenciado.id", ondelete="CASCADE"), index=True)
 
     id_especialidade = Column(Integer, ForeignKey("especialidade.id", ondelete="CASCADE"))
 
@@ -244,7 +370,7 @@ class CredenciadoDiferencial(Base):
 
     id = Column(Integer, primary_key=True, autoincrement=True)
 
-    id_credenciado = Column(Integer, ForeignKey("credenciado.id", ondelete="CASCADE"))
+    id_credenciado = Column(Integer, ForeignKey("credenciado.id", ondelete="CASCADE"), index=True)
 
     id_diferencial = Column(Integer, ForeignKey("diferencial.id", ondelete="CASCADE"))
 
@@ -258,7 +384,7 @@ class CredenciadoRede(Base):
 
     id = Column(Integer, primary_key=True, autoincrement=True)
 
-    id_credenciado = Column(Integer, ForeignKey("credenciado.id", ondelete="CASCADE"))
+    id_credenciado = Column(Integer, ForeignKey("credenciado.id", ondelete="CASCADE"), index=True)
 
     id_rede = Column(Integer, ForeignKey("rede.id", ondelete="CASCADE"))
 
@@ -272,7 +398,7 @@ class CredenciadoComplexidade(Base):
 
     id = Column(Integer, primary_key=True, autoincrement=True)
 
-    id_credenciado = Column(Integer, ForeignKey("credenciado.id", ondelete="CASCADE"))
+    id_credenciado = Column(Integer, ForeignKey("credenciado.id", ondelete="CASCADE"), index=True)
 
     id_especialidade = Column(Integer, ForeignKey("especialidade.id", ondelete="SET NULL"))
 
@@ -284,3 +410,49 @@ class CredenciadoComplexidade(Base):
 
     especialidade = relationship("Especialidade")
 
+
+
+class CredenciadoExcluido(Base):
+
+    __tablename__ = "credenciado_excluido"
+
+    
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+
+    id_credenciado = Column(Integer, nullable=False)
+
+    excluido_em = Column(DateTime, default=func.now(), nullable=False, index=True)
+
+
+
+class EventoCredenciado(Base):
+
+    __tablename__ = "credenciado_evento"
+
+    
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+
+    id_credenciado = Column(Integer, nullable=False)
+
+    operacao = Column(String(10), nullable=False)
+
+    campos = Column(Text)
+
+    criado_em = Column(DateTime, default=func.now(), nullable=False)
+
+
+
+class PosicaoConsumidor(Base):
+
+    __tablename__ = "credenciado_evento_consumidor"
+
+    
+
+    consumidor = Column(String(50), primary_key=True)
+
+    ultimo_id = Column(Integer, nullable=False, default=0)
+
+    atualizado_em = Column(DateTime, default=func.now(), onupdate=func.now())
+
@@ -0,0 +1,111 @@
+"""
+Outbox transacional das escritas em credenciados.
+Os fluxos de escrita registram eventos (insert/update/delete) na mesma transação dos dados;
+consumidores locais leem em lotes a partir da última posição confirmada.
+"""
+
+
+
+import datetime
+
+import json
+
+
+
+from sqlalchemy import func, insert, select
+
+
+
+from models import EventoCredenciado, PosicaoConsumidor
+
+from sincronizacao import ATRASO_SEGUNDOS
+
+
+
+OPERACOES = ('insert', 'update', 'delete')
+
+LOTE_EVENTOS = 500
+
+
+
+def registrar_eventos(db, eventos):
+
+    """Adiciona [(operacao, id_credenciado, campos)] à transação corrente de db em um único statement; não faz commit"""
+
+    if not eventos:
+
+        return
+
+    db.execute(insert(EventoCredenciado), [{
+
+        "id_credenciado": credenciado_id,
+
+        "operacao": operacao,
+
+        "campos": json.dumps(sorted(campos)) if campos else None,
+
+    } for operacao, credenciado_id, campos in eventos])
+
+
+
+def ler_eventos(db, apos_id=0, limite=LOTE_EVENTOS):
+
+    """Eventos com id > apos_id em ordem; os dos últimos ATRASO_SEGUNDOS ficam para a próxima leitura"""
+
+    corte = db.scalar(select(func.now())) - datetime.timedelta(seconds=ATRASO_SEGUNDOS)
+
+    linhas = db.execute(
+
+        select(EventoCredenciado)
+
+        .where(EventoCredenciado.id > apos_id, EventoCredenciado.criado_em <= corte)
+
+        .order_by(EventoCredenciado.id)
+
+        .limit(limite)
+
+    ).scalars()
+
+    return [{
+
+        "id": evento.id,
+
+        "id_credenciado": evento.id_credenciado,
+
+        "operacao": evento.operacao,
+
+        "campos": json.loads(evento.campos) if evento.campos else None,
+
+        "criado_em": evento.criado_em.isoformat(),
+
+    } for evento in linhas]
+
+
+
+def consumir(db, consumidor, processar, limite=LOTE_EVENTOS):
+
+    """Entrega o próximo lote do consumidor a processar(eventos) e só então avança a posição dele (pelo menos uma vez).
+    Retorna quantos eventos foram processados"""
+
+    posicao = db.get(PosicaoConsumidor, consumidor)
+
+    eventos = ler_eventos(db, posicao.ultimo_id if posicao else 0, limite)
+
+    if not eventos:
+
+        return 0
+
+    processar(eventos)
+
+    if posicao is None:
+
+        posicao = PosicaoConsumidor(consumidor=consumidor)
+
+        db.add(posicao)
+
+    posicao.ultimo_id = eventos[-1]["id"]
+
+    db.commit()
+
+    return len(eventos)
+
@@ -44,6 +44,8 @@ class CredenciadoBase(BaseModel):
 
     nome: str
 
+    credenciamento: Optional[str] = None
+
     crm: Optional[str] = None
 
     telefone: Optional[str] = None
@@ -90,12 +92,16 @@ class CredenciadoCreate(CredenciadoBase):
 
     redes_ids: Optional[List[int]] = []
 
+    complexidades_especialidades_ids: Optional[List[int]] = []
+
 
 
 class CredenciadoUpdate(BaseModel):
 
     nome: Optional[str] = None
 
+    credenciamento: Optional[str] = None
+
     crm: Optional[str] = None
 
     telefone: Optional[str] = None
@@ -138,6 +144,14 @@ class CredenciadoUpdate(BaseModel):
 
     redes_ids: Optional[List[int]] = None
 
+    complexidades_especialidades_ids: Optional[List[int]] = None
+
+
+
+class CredenciadoBulkUpdate(CredenciadoUpdate):
+
+    id: int
+
 
 
 class CredenciadoResponse(CredenciadoBase):
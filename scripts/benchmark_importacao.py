@@ -0,0 +1,283 @@
+"""
+Benchmark do upload de planilhas (/api/importacoes/upload).
+Cria um banco SQLite temporário (ou usa BENCH_DATABASE_URL) com N credenciados, gera um CSV que
+exercita todos os critérios de correspondência (código, crm, email, telefone, nome+cidade e novos)
+e mede o tempo do upload até a importação concluir, as consultas emitidas e um resumo (hash) do estado final da tabela.
+ATENÇÃO: as tabelas do banco de benchmark são recriadas a cada execução.
+Execute: python scripts/benchmark_importacao.py [--existentes 20000] [--linhas 5000]
+"""
+
+
+
+import argparse
+
+import contextlib
+
+import hashlib
+
+import io
+
+import os
+
+import sys
+
+import tempfile
+
+import time
+
+
+
+
+
+_tmpdir = tempfile.mkdtemp(prefix='bench_importacao_')
+
+os.environ['DATABASE_URL'] = os.getenv('BENCH_DATABASE_URL', f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}")
+
+os.environ['INDICE_FACETAS'] = '0'
+
+
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+
+from sqlalchemy import event, func, insert, select
+
+
+
+from database import Base, engine
+
+from models import Credenciado
+
+from main import create_app
+
+
+
+
+
+CIDADES = ['São Paulo', 'Campinas', 'Santos', 'Sorocaba']
+
+LOTE = 20000
+
+
+
+
+
+def popular(total):
+
+    """Recria as tabelas e insere `total` credenciados com chaves de correspondência previsíveis"""
+
+    Base.metadata.drop_all(bind=engine)
+
+    Base.metadata.create_all(bind=engine)
+
+    for inicio in range(0, total, LOTE):
+
+        with engine.begin() as conn:
+
+            conn.execute(insert(Credenciado), [{
+
+                "credenciamento": str(100000 + i),
+
+                "nome": f"Prestador {i}",
+
+                "crm": f"CRM{i}",
+
+                "email": f"p{i}@exemplo.com",
+
+                "telefone": f"11{i:08d}",
+
+                "cidade": CIDADES[i % len(CIDADES)],
+
+                "status": "Ativo",
+
+            } for i in range(inicio, min(inicio + LOTE, total))])
+
+
+
+
+
+def gerar_csv(linhas, existentes):
+
+    """CSV no layout do importador; cada linha cai em um critério de correspondência diferente"""
+
+    saida = io.StringIO()
+
+    saida.write("nome,crm,telefone,email,status,cidade,credenciamento\n")
+
+    for k in range(linhas):
+
+        i = k % existentes
+
+        tipo = k % 10
+
+        nome, crm, telefone, email = f"Prestador {i}", f"CRM{i}", f"11{i:08d}", f"p{i}@exemplo.com"
+
+        cidade, codigo = CIDADES[i % len(CIDADES)], str(100000 + i)
+
+        if tipo in (4, 5):
+
+            codigo = ''
+
+            telefone = email = ''
+
+        elif tipo == 6:
+
+            codigo, crm, telefone = str(900000 + k), '', ''
+
+        elif tipo == 7:
+
+            codigo, crm, email = f"{900000 + k}.0", '', ''
+
+        elif tipo == 8:
+
+            codigo, crm, email, telefone = str(900000 + k), '', '', ''
+
+        elif tipo == 9:
+
+            nome, codigo = f"Novo {k}", str(900000 + k)
+
+            crm, email, telefone = f"NCRM{k}", f"novo{k}@exemplo.com", f"21{k:08d}"
+
+        saida.write(f"{nome},{crm},{telefone},{email},Em análise,{cidade},{codigo}\n")
+
+    return saida.getvalue().encode('utf-8')
+
+
+
+
+
+def resumo_tabela():
+
+    """Hash do conteúdo relevante da tabela, para comparar implementações"""
+
+    digest = hashlib.sha1()
+
+    with engine.connect() as conn:
+
+        for linha in conn.execute(select(
+
+            Credenciado.id, Credenciado.credenciamento, Credenciado.nome, Credenciado.crm,
+
+            Credenciado.email, Credenciado.telefone, Credenciado.cidade, Credenciado.status,
+
+        ).order_by(Credenciado.id)):
+
+            digest.update(repr(tuple(linha)).encode('utf-8'))
+
+    return digest.hexdigest()[:16]
+
+
+
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--existentes', type=int, default=20000)
+
+    parser.add_argument('--linhas', type=int, default=5000)
+
+    args = parser.parse_args()
+
+
+
+    app = create_app()
+
+    client = app.test_client()
+
+    with client.session_transaction() as sessao:
+
+        sessao['cargo'] = 'admin'
+
+
+
+    print(f"Banco: {engine.url}")
+
+    popular(args.existentes)
+
+    arquivo = gerar_csv(args.linhas, args.existentes)
+
+
+
+    consultas = []
+
+    def contar(conn, cursor, statement, parameters, context, executemany):
+
+        consultas.append(statement)
+
+
+
+    event.listen(engine, 'before_cursor_execute', contar)
+
+    inicio = time.perf_counter()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+
+        resposta = client.post(
+
+            '/api/importacoes/upload',
+
+            data={'file': (io.BytesIO(arquivo), 'bench.csv')},
+
+            content_type='multipart/form-data',
+
+        )
+
+        importacao_id = resposta.get_json()['importacao_id']
+
+        while True:
+
+            dados = client.get(f'/api/importacoes/{importacao_id}').get_json()
+
+            if dados['status'] in ('concluida', 'erro'):
+
+                break
+
+            time.sleep(0.05)
+
+    duracao = time.perf_counter() - inicio
+
+    event.remove(engine, 'before_cursor_execute', contar)
+
+
+
+    with engine.connect() as conn:
+
+        total_no_banco = conn.execute(select(func.count()).select_from(Credenciado)).scalar()
+
+    print(f"{args.existentes} credenciados, arquivo com {args.linhas} linhas")
+
+    print(f"  status HTTP         {resposta.status_code}")
+
+    print(f"  status da importação {dados['status']} {dados.get('mensagem') or ''}")
+
+    print(f"  tempo               {duracao:.2f} s")
+
+    print(f"  consultas           {len(consultas)}")
+
+    for chave in ('registros_importados', 'registros_atualizados', 'duplicados_ignorados_no_arquivo'):
+
+        print(f"  {chave:<19} {dados.get(chave)}")
+
+    print(f"  total_no_banco      {total_no_banco}")
+
+    print(f"  erros               {dados.get('total_erros')}")
+
+    print(f"  hash da tabela      {resumo_tabela()}")
+
+
+
+    if engine.url.get_backend_name() == 'sqlite':
+
+        print(f"\nBanco temporário em {_tmpdir}")
+
+
+
+
+
+if __name__ == '__main__':
+
+    main()
+
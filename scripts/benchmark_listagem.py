@@ -0,0 +1,302 @@
+"""
+Benchmark da listagem de credenciados: joinedload (legado) x páginas de ids + selectinload.
+Cria um banco SQLite temporário (ou usa BENCH_DATABASE_URL) com N credenciados e mede
+latência e linhas transferidas por página.
+ATENÇÃO: as tabelas do banco de benchmark são recriadas a cada tamanho.
+Execute: python scripts/benchmark_listagem.py [--tamanhos 10000,100000,1000000] [--limit 100]
+"""
+
+
+
+import argparse
+
+import os
+
+import sys
+
+import tempfile
+
+import time
+
+
+
+
+
+_tmpdir = tempfile.mkdtemp(prefix='bench_listagem_')
+
+os.environ['DATABASE_URL'] = os.getenv('BENCH_DATABASE_URL', f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}")
+
+
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+
+from sqlalchemy import event, insert
+
+from sqlalchemy.orm import joinedload
+
+
+
+from database import Base, engine, db_session
+
+from models import (
+
+    Credenciado, Especialidade, Diferencial, Rede,
+
+    CredenciadoEspecialidade, CredenciadoDiferencial, CredenciadoRede, CredenciadoComplexidade
+
+)
+
+from blueprints.credenciados import _pagina_ids, _carregar_credenciados
+
+
+
+
+
+ESPECIALIDADES_POR_CREDENCIADO = 10
+
+REDES_POR_CREDENCIADO = 3
+
+DIFERENCIAIS_POR_CREDENCIADO = 2
+
+COMPLEXIDADES_POR_CREDENCIADO = 2
+
+LOTE = 20000
+
+
+
+
+
+def popular(total):
+
+    """Recria as tabelas e insere `total` credenciados com suas associações"""
+
+    Base.metadata.drop_all(bind=engine)
+
+    Base.metadata.create_all(bind=engine)
+
+    with engine.begin() as conn:
+
+        conn.execute(insert(Especialidade), [{"descricao": f"Especialidade {i}"} for i in range(1, 51)])
+
+        conn.execute(insert(Diferencial), [{"descricao": f"Diferencial {i}"} for i in range(1, 11)])
+
+        conn.execute(insert(Rede), [{"nome": f"Rede {i}"} for i in range(1, 21)])
+
+
+
+    for inicio in range(1, total + 1, LOTE):
+
+        fim = min(inicio + LOTE, total + 1)
+
+        ids = range(inicio, fim)
+
+        with engine.begin() as conn:
+
+            conn.execute(insert(Credenciado), [{
+
+                "id": i,
+
+                "nome": f"Credenciado {i}",
+
+                "status": "Ativo",
+
+                "cidade": "São Paulo",
+
+                "estado": "SP",
+
+                "tipo": "Clínica",
+
+            } for i in ids])
+
+            conn.execute(insert(CredenciadoEspecialidade), [
+
+                {"id_credenciado": i, "id_especialidade": (i + k) % 50 + 1}
+
+                for i in ids for k in range(ESPECIALIDADES_POR_CREDENCIADO)
+
+            ])
+
+            conn.execute(insert(CredenciadoRede), [
+
+                {"id_credenciado": i, "id_rede": (i + k) % 20 + 1}
+
+                for i in ids for k in range(REDES_POR_CREDENCIADO)
+
+            ])
+
+            conn.execute(insert(CredenciadoDiferencial), [
+
+                {"id_credenciado": i, "id_diferencial": (i + k) % 10 + 1}
+
+                for i in ids for k in range(DIFERENCIAIS_POR_CREDENCIADO)
+
+            ])
+
+            conn.execute(insert(CredenciadoComplexidade), [
+
+                {"id_credenciado": i, "id_especialidade": (i + k) % 50 + 1}
+
+                for i in ids for k in range(COMPLEXIDADES_POR_CREDENCIADO)
+
+            ])
+
+
+
+
+
+def listagem_joinedload(db, skip, limit):
+
+    return db.query(Credenciado).options(
+
+        joinedload(Credenciado.especialidades),
+
+        joinedload(Credenciado.diferenciais),
+
+        joinedload(Credenciado.redes),
+
+        joinedload(Credenciado.complexidades).joinedload(CredenciadoComplexidade.especialidade),
+
+    ).offset(skip).limit(limit).all()
+
+
+
+
+
+def listagem_selectin(db, skip, limit):
+
+    return _carregar_credenciados(db, _pagina_ids(db, [], skip, limit))
+
+
+
+
+
+def medir(funcao, skip, limit, repeticoes=5):
+
+    """Retorna (latência média em ms, consultas, linhas transferidas) de uma página"""
+
+    capturadas = []
+
+
+
+    def capturar(conn, cursor, statement, parameters, context, executemany):
+
+        capturadas.append((statement, parameters))
+
+
+
+    db = db_session()
+
+    funcao(db, skip, limit)
+
+    db_session.remove()
+
+
+
+    inicio = time.perf_counter()
+
+    for _ in range(repeticoes):
+
+        db = db_session()
+
+        funcao(db, skip, limit)
+
+        db_session.remove()
+
+    latencia = (time.perf_counter() - inicio) * 1000 / repeticoes
+
+
+
+    event.listen(engine, 'before_cursor_execute', capturar)
+
+    try:
+
+        db = db_session()
+
+        funcao(db, skip, limit)
+
+        db_session.remove()
+
+    finally:
+
+        event.remove(engine, 'before_cursor_execute', capturar)
+
+
+
+    linhas = 0
+
+    raw = engine.raw_connection()
+
+    try:
+
+        cursor = raw.cursor()
+
+        for statement, parameters in capturadas:
+
+            cursor.execute(statement, parameters)
+
+            linhas += len(cursor.fetchall())
+
+    finally:
+
+        raw.close()
+
+    return latencia, len(capturadas), linhas
+
+
+
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--tamanhos', default='10000,100000,1000000')
+
+    parser.add_argument('--limit', type=int, default=100)
+
+    args = parser.parse_args()
+
+
+
+    print(f"Banco: {engine.url}")
+
+    for total in [int(t) for t in args.tamanhos.split(',') if t]:
+
+        print("\n" + "=" * 70)
+
+        print(f"{total} credenciados")
+
+        print("=" * 70)
+
+        inicio = time.perf_counter()
+
+        popular(total)
+
+        print(f"Carga: {time.perf_counter() - inicio:.1f}s")
+
+
+
+        for rotulo, skip in (("primeira página", 0), ("página do meio", total // 2)):
+
+            for nome, funcao in (("joinedload", listagem_joinedload), ("ids+selectin", listagem_selectin)):
+
+                latencia, consultas, linhas = medir(funcao, skip, args.limit)
+
+                print(f"  {rotulo:<16} {nome:<13} {latencia:9.1f} ms  {consultas:2d} consultas  {linhas:7d} linhas")
+
+
+
+    if engine.url.get_backend_name() == 'sqlite':
+
+        print(f"\nBanco temporário em {_tmpdir}")
+
+
+
+
+
+if __name__ == '__main__':
+
+    main()
+
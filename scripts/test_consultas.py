@@ -0,0 +1,286 @@
+"""
+Script para verificar o número de consultas SQL por requisição dos endpoints de credenciados.
+Roda contra um banco SQLite temporário; falha (código 1) se alguma contagem mudar.
+Execute: python scripts/test_consultas.py
+"""
+
+
+
+import os
+
+import sys
+
+import tempfile
+
+
+
+
+
+_tmpdir = tempfile.mkdtemp(prefix='test_consultas_')
+
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_tmpdir, 'consultas.db')}"
+
+os.environ['INDICE_FACETAS'] = '0'
+
+
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+
+from sqlalchemy import event
+
+
+
+from database import engine, db_session
+
+from models import (
+
+    Credenciado, Especialidade, Diferencial, Rede, CredenciadoComplexidade
+
+)
+
+from main import create_app
+
+
+
+
+
+CONSULTAS_ESPERADAS = {
+
+    "GET /api/credenciados/<id>": 2,
+
+    "GET /api/credenciados/batch?ids=...": 2,
+
+    "POST /api/credenciados/batch": 2,
+
+    "PUT /api/credenciados/<id> (só campos)": 5,
+
+    "PUT /api/credenciados/<id> (associações inalteradas)": 4,
+
+    "GET /api/credenciados/": 7,
+
+    "GET /api/credenciados/?fields=... (total em cache)": 2,
+
+    "GET /api/credenciados/?include=... (total em cache)": 3,
+
+    "GET /api/credenciados/<id> (304)": 1,
+
+    "GET /api/credenciados/ (304)": 1,
+
+    "DELETE /api/credenciados/<id>": 7,
+
+}
+
+
+
+
+
+class ContadorConsultas:
+
+    """Conta os statements enviados ao banco enquanto ativo"""
+
+
+
+    def __init__(self):
+
+        self.total = 0
+
+
+
+    def _contar(self, conn, cursor, statement, parameters, context, executemany):
+
+        self.total += 1
+
+
+
+    def __enter__(self):
+
+        event.listen(engine, 'before_cursor_execute', self._contar)
+
+        return self
+
+
+
+    def __exit__(self, *exc):
+
+        event.remove(engine, 'before_cursor_execute', self._contar)
+
+
+
+
+
+def popular():
+
+    """Insere alguns credenciados com todas as associações"""
+
+    db = db_session()
+
+    especialidades = [Especialidade(descricao=f"Especialidade {i}") for i in range(4)]
+
+    diferenciais = [Diferencial(descricao=f"Diferencial {i}") for i in range(2)]
+
+    redes = [Rede(nome=f"Rede {i}") for i in range(2)]
+
+    db.add_all(especialidades + diferenciais + redes)
+
+    db.flush()
+
+    for i in range(5):
+
+        credenciado = Credenciado(nome=f"Credenciado {i}", cidade="São Paulo", status="Ativo")
+
+        credenciado.especialidades = especialidades
+
+        credenciado.diferenciais = diferenciais
+
+        credenciado.redes = redes
+
+        db.add(credenciado)
+
+        db.flush()
+
+        db.add(CredenciadoComplexidade(id_credenciado=credenciado.id, id_especialidade=especialidades[0].id))
+
+    db.commit()
+
+    db_session.remove()
+
+
+
+
+
+def medir(client, metodo, url, **kwargs):
+
+    with ContadorConsultas() as contador:
+
+        resposta = client.open(url, method=metodo, **kwargs)
+
+    assert resposta.status_code < 400, f"{metodo} {url}: {resposta.status_code} {resposta.get_data(as_text=True)}"
+
+    return contador.total
+
+
+
+
+
+def test_consultas_por_requisicao():
+
+    """Compara o número de consultas de cada endpoint com o esperado"""
+
+    app = create_app()
+
+    client = app.test_client()
+
+    with client.session_transaction() as sessao:
+
+        sessao['cargo'] = 'admin'
+
+    popular()
+
+
+
+    medidas = {
+
+        "GET /api/credenciados/<id>": medir(client, 'GET', '/api/credenciados/1'),
+
+        "GET /api/credenciados/batch?ids=...": medir(client, 'GET', '/api/credenciados/batch?ids=1,2,3'),
+
+        "POST /api/credenciados/batch": medir(
+
+            client, 'POST', '/api/credenciados/batch', json={"ids": [1, 2, 3, 4, 5]}
+
+        ),
+
+        "PUT /api/credenciados/<id> (só campos)": medir(
+
+            client, 'PUT', '/api/credenciados/1', json={"telefone": "(11) 4000-0000"}
+
+        ),
+
+        "PUT /api/credenciados/<id> (associações inalteradas)": medir(
+
+            client, 'PUT', '/api/credenciados/1', json={
+
+                "especialidades_ids": [4, 3, 2, 1],
+
+                "diferenciais_ids": [1, 2],
+
+                "redes_ids": [2, 1],
+
+                "complexidades_especialidades_ids": [1],
+
+            }
+
+        ),
+
+        "GET /api/credenciados/": medir(client, 'GET', '/api/credenciados/'),
+
+        "GET /api/credenciados/?fields=... (total em cache)": medir(
+
+            client, 'GET', '/api/credenciados/?fields=id,nome,latitude,longitude,status'
+
+        ),
+
+        "GET /api/credenciados/?include=... (total em cache)": medir(
+
+            client, 'GET', '/api/credenciados/?include=especialidades,diferenciais,redes,complexidades'
+
+        ),
+
+        "GET /api/credenciados/<id> (304)": medir(
+
+            client, 'GET', '/api/credenciados/1',
+
+            headers={"If-None-Match": client.get('/api/credenciados/1').headers['ETag']},
+
+        ),
+
+        "GET /api/credenciados/ (304)": medir(
+
+            client, 'GET', '/api/credenciados/',
+
+            headers={"If-None-Match": client.get('/api/credenciados/').headers['ETag']},
+
+        ),
+
+        "DELETE /api/credenciados/<id>": medir(client, 'DELETE', '/api/credenciados/5'),
+
+    }
+
+
+
+    falhas = []
+
+    for endpoint, esperado in CONSULTAS_ESPERADAS.items():
+
+        obtido = medidas[endpoint]
+
+        marca = "✓" if obtido == esperado else "✗"
+
+        print(f"{marca} {endpoint}: {obtido} consultas (esperado {esperado})")
+
+        if obtido != esperado:
+
+            falhas.append(endpoint)
+
+    assert not falhas, f"Número de consultas mudou em: {', '.join(falhas)}"
+
+
+
+
+
+if __name__ == "__main__":
+
+    try:
+
+        test_consultas_por_requisicao()
+
+    except AssertionError as e:
+
+        print(f"\n✗ {e}")
+
+        sys.exit(1)
+
+    print("\n✓ Contagem de consultas OK")
+
@@ -0,0 +1,191 @@
+"""
+Sincronização incremental do cadastro: credenciados criados/alterados (por ultima_atualizacao, id)
+e excluídos (registros em credenciado_excluido) desde um token opaco.
+"""
+
+
+
+import base64
+
+import datetime
+
+import json
+
+
+
+from sqlalchemy import and_, func, or_, select, update
+
+
+
+from models import Credenciado, CredenciadoExcluido
+
+
+
+ATRASO_SEGUNDOS = 5
+
+MAX_ALTERACOES = 5000
+
+
+
+def codificar_token(ultima, credenciado_id, excluido_id):
+
+    bruto = json.dumps({
+
+        "t": ultima.isoformat() if ultima else None,
+
+        "i": credenciado_id,
+
+        "e": excluido_id,
+
+    }, separators=(',', ':')).encode('utf-8')
+
+    return base64.urlsafe_b64encode(bruto).decode('ascii').rstrip('=')
+
+
+
+def decodificar_token(token):
+
+    """Retorna (ultima_atualizacao, id, id do último excluído) de um token; levanta ValueError se inválido"""
+
+    try:
+
+        dados = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+
+        ultima = datetime.datetime.fromisoformat(dados['t']) if dados['t'] else None
+
+        credenciado_id = int(dados['i'])
+
+        excluido_id = int(dados['e'])
+
+    except Exception:
+
+        raise ValueError("token inválido")
+
+    return ultima, credenciado_id, excluido_id
+
+
+
+def token_inicial(db):
+
+    """Token de uma carga completa: todos os credenciados, sem as exclusões anteriores a ela"""
+
+    return codificar_token(None, 0, db.scalar(select(func.coalesce(func.max(CredenciadoExcluido.id), 0))))
+
+
+
+def alteracoes_desde(db, token, limite):
+
+    """(ids alterados, ids excluídos, próximo token, há mais) a partir do token, em ordem de alteração.
+    Alterações dos últimos ATRASO_SEGUNDOS ficam para a próxima chamada, para não pular transações em andamento"""
+
+    ultima, credenciado_id, excluido_id = decodificar_token(token)
+
+    corte = db.scalar(select(func.now())) - datetime.timedelta(seconds=ATRASO_SEGUNDOS)
+
+    
+
+    consulta = (
+
+        select(Credenciado.id, Credenciado.ultima_atualizacao)
+
+        .where(Credenciado.ultima_atualizacao <= corte)
+
+        .order_by(Credenciado.ultima_atualizacao, Credenciado.id)
+
+        .limit(limite + 1)
+
+    )
+
+    if ultima is not None:
+
+        consulta = consulta.where(or_(
+
+            Credenciado.ultima_atualizacao > ultima,
+
+            and_(Credenciado.ultima_atualizacao == ultima, Credenciado.id > credenciado_id),
+
+        ))
+
+    alterados = db.execute(consulta).all()
+
+    
+
+    excluidos = db.execute(
+
+        select(CredenciadoExcluido.id, CredenciadoExcluido.id_credenciado)
+
+        .where(CredenciadoExcluido.id > excluido_id, CredenciadoExcluido.excluido_em <= corte)
+
+        .order_by(CredenciadoExcluido.id)
+
+        .limit(limite + 1)
+
+    ).all()
+
+    
+
+    ha_mais = len(alterados) > limite or len(excluidos) > limite
+
+    alterados, excluidos = alterados[:limite], excluidos[:limite]
+
+    if alterados:
+
+        credenciado_id, ultima = alterados[-1].id, alterados[-1].ultima_atualizacao
+
+    if excluidos:
+
+        excluido_id = excluidos[-1].id
+
+    return (
+
+        [linha.id for linha in alterados],
+
+        [linha.id_credenciado for linha in excluidos],
+
+        codificar_token(ultima, credenciado_id, excluido_id),
+
+        ha_mais,
+
+    )
+
+
+
+def marcar_alterados(db, *subconsultas):
+
+    """Avança versao e ultima_atualizacao dos credenciados cujos ids vêm das subconsultas, sem commit.
+    Usado quando um item de catálogo embutido neles é renomeado ou excluído, para que ETags e a sincronização mudem"""
+
+    db.execute(
+
+        update(Credenciado)
+
+        .where(or_(*(Credenciado.id.in_(subconsulta) for subconsulta in subconsultas)))
+
+        .values(versao=Credenciado.versao + 1)
+
+        .execution_options(synchronize_session=False)
+
+    )
+
+
+
+def preencher_ultima_atualizacao(engine):
+
+    """Marca com a data atual os credenciados antigos sem ultima_atualizacao, para que entrem na sincronização"""
+
+    with engine.begin() as conn:
+
+        total = conn.execute(
+
+            update(Credenciado.__table__)
+
+            .where(Credenciado.__table__.c.ultima_atualizacao.is_(None))
+
+            .values(ultima_atualizacao=func.now())
+
+        ).rowcount
+
+    if total:
+
+        print(f"[v0] ✓ ultima_atualizacao preenchida em {total} credenciados")
+